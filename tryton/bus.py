@@ -22,6 +22,23 @@ ID = str(uuid.uuid4())
 CHANNELS = [
     'client:%s' % ID,
     ]
+# The models whose changes invalidate the cached views
+VIEW_MODELS = {'ir.ui.view', 'ir.action.keyword', 'ir.model.field'}
+
+
+def channels():
+    """Return the channels to poll
+    The server publishes the record messages of a model on the channel
+    'model:<name>', the models of the views and of the opened groups are
+    subscribed."""
+    from tryton.gui.window.view_form.model.group import Group
+    models = set(VIEW_MODELS)
+    try:
+        models.update(g.model_name for g in list(Group._instances.values()))
+    except RuntimeError:
+        # The groups changed during the iteration
+        pass
+    return CHANNELS + ['model:%s' % m for m in sorted(models)]
 
 
 def listen(connection):
@@ -48,14 +65,17 @@ def _listen(connection):
                 time.sleep(1)
                 continue
             url = connection.url + '/bus'
+        # The channels of the groups opened meanwhile are subscribed on the
+        # next poll
+        channels_ = channels()
         request = Request(url,
             data=json.dumps({
                     'last_message': last_message,
-                    'channels': CHANNELS,
+                    'channels': channels_,
                     }).encode('utf-8'),
             headers=headers)
         logger.info('poll channels %s with last message %s',
-            CHANNELS, last_message)
+            channels_, last_message)
         try:
             response = urlopen(request, timeout=bus_timeout)
             wait = 1
@@ -88,10 +108,32 @@ def _listen(connection):
 
 
 def handle(message):
-    from tryton.gui.main import Main
-
-    app = Main()
     if message['type'] == 'notification':
+        from tryton.gui.main import Main
+        app = Main()
         app.show_notification(
             message.get('title', ''), message.get('body', ''),
             message.get('priority', 1))
+    elif message['type'] == 'record':
+        invalidate(message)
+
+
+def invalidate(message):
+    """Invalidate the caches of the records changed by another client
+    The message contains the model, the ids and optionally the timestamps
+    by id of the records."""
+    if message.get('client') == ID:
+        return
+    from tryton import rpc
+    from tryton.common import completion, on_change, selection
+    from tryton.gui.window.view_form.model.group import Group
+
+    model = message['model']
+    rpc.invalidate_cache(model)
+    if model in VIEW_MODELS:
+        rpc.clear_cache()
+    selection.invalidate(model)
+    on_change.CACHE.invalidate(model)
+    completion.CACHE.invalidate(model)
+    Group.records_changed(
+        model, message.get('ids', []), message.get('timestamps'))
@@ -3,16 +3,16 @@
 from . import timedelta
 from .common import (
     COLOR_RGB, COLOR_SCHEMES, COLORS, FORMAT_ERROR, MODELACCESS, MODELHISTORY,
-    MODELNAME, MODELNOTIFICATION, TRYTON_ICON, VIEW_SEARCH, IconFactory,
-    Logout, RPCContextReload, RPCException, RPCExecute, RPCProgress, Tooltips,
-    apply_label_attributes, ask, check_version, concurrency, data2pixbuf,
-    date_format, ellipsize, error, file_open, file_selection, file_write,
-    filter_domain, generateColorscheme, get_align, get_credentials,
-    get_gdk_backend, get_hostname, get_port, get_sensible_widget,
-    get_toplevel_window, hex2rgb, highlight_rgb, humanize, idle_add, mailto,
-    message, node_attributes, process_exception, resize_pixbuf, selection,
-    setup_window, slugify, sur, sur_3b, timezoned_date, to_xml,
-    untimezoned_date, url_open, userwarning, warning)
+    MODELNAME, MODELNOTIFICATION, MODELSTORE, TRYTON_ICON, VIEW_SEARCH,
+    IconFactory, Logout, RPCContextReload, RPCException, RPCExecute,
+    RPCProgress, Tooltips, apply_label_attributes, ask, check_version,
+    concurrency, data2pixbuf, date_format, ellipsize, error, file_open,
+    file_selection, file_write, filter_domain, generateColorscheme, get_align,
+    get_credentials, get_gdk_backend, get_hostname, get_port,
+    get_sensible_widget, get_toplevel_window, hex2rgb, highlight_rgb, humanize,
+    idle_add, mailto, message, node_attributes, parse_arch, process_exception,
+    resize_pixbuf, selection, setup_window, slugify, sur, sur_3b,
+    timezoned_date, to_xml, untimezoned_date, url_open, userwarning, warning)
 from .domain_inversion import (
     concat, domain_inversion, eval_domain, extract_reference_models,
     filter_leaf, inverse_leaf, localize_domain, merge,
@@ -31,6 +31,7 @@ __all__ = [
     MODELHISTORY,
     MODELNAME,
     MODELNOTIFICATION,
+    MODELSTORE,
     RPCContextReload,
     RPCException,
     RPCExecute,
@@ -73,6 +74,7 @@ __all__ = [
     merge,
     message,
     node_attributes,
+    parse_arch,
     prepare_reference_domain,
     process_exception,
     resize_pixbuf,
@@ -3,6 +3,8 @@
 
 import colorsys
 import gettext
+import hashlib
+import json
 import locale
 import logging
 import os
@@ -10,13 +12,17 @@ import platform
 import re
 import subprocess
 import tempfile
+import threading
+import time
 import unicodedata
+import xml.dom.minidom
 import xml.etree.ElementTree as ET
-from collections import defaultdict
+from collections import OrderedDict
 from decimal import Decimal
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from pathlib import PurePath
-from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
+from urllib.parse import (
+    parse_qs, quote, urlencode, urlparse, urlunparse)
 
 try:
     from http import HTTPStatus
@@ -36,7 +42,7 @@ from functools import lru_cache, wraps
 from string import Template
 
 import tryton.rpc as rpc
-from tryton.config import CONFIG, PIXMAPS_DIR, TRYTON_ICON
+from tryton.config import CONFIG, PIXMAPS_DIR, TRYTON_ICON, get_config_dir
 
 try:
     import ssl
@@ -51,6 +57,7 @@ from tryton import __version__
 from tryton.exceptions import TrytonError, TrytonServerError
 from tryton.pyson import PYSONEncoder
 
+from .image_loader import ImageLoader
 from .underline import set_underline
 from .widget_style import widget_class
 
@@ -61,11 +68,18 @@ logger = logging.getLogger(__name__)
 class IconFactory:
 
     batchnum = 10
-    _tryton_icons = []
-    _name2id = {}
     _icons = {}
+    _name2id = {}
+    _index = {}
+    _unknown = set()
     _local_icons = {}
-    _pixbufs = defaultdict(dict)
+    _pixbufs = {}
+    _lock = Lock()
+    _url_loader = None
+    _url_pixbufs = OrderedDict()
+    _url_failures = {}
+    _url_callbacks = {}
+    _placeholders = {}
 
     @classmethod
     def load_local_icons(cls):
@@ -74,104 +88,276 @@ class IconFactory:
             path = os.path.join(PIXMAPS_DIR, fname)
             cls._local_icons[name] = path
 
+    @staticmethod
+    def _path(*names):
+        return os.path.join(get_config_dir(), 'icons', *names)
+
+    @classmethod
+    def _index_path(cls):
+        return cls._path(quote('%s/%s.json' % (
+                    CONFIG['login.host'], CONFIG['login.db']), safe=''))
+
+    @staticmethod
+    def _write(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(data)
+        os.replace(tmp, path)
+
+    @classmethod
+    def _save_index(cls, index_path):
+        with cls._lock:
+            data = json.dumps(cls._index).encode('utf-8')
+        try:
+            cls._write(index_path, data)
+        except OSError:
+            logger.warning("Unable to store icons index")
+
     @classmethod
     def load_icons(cls, refresh=False):
+        "Load the list of icons and revalidate the disk store"
+        index_path = cls._index_path()
         if not refresh:
+            with cls._lock:
+                cls._icons.clear()
+                cls._name2id.clear()
+                cls._index.clear()
+                cls._unknown.clear()
+                cls._pixbufs.clear()
+            try:
+                with open(index_path, 'r') as fp:
+                    index = json.load(fp)
+            except (OSError, ValueError):
+                index = {}
+        try:
+            icons = rpc.execute(
+                'model', 'ir.ui.icon', 'list_icons', rpc.CONTEXT)
+        except TrytonServerError:
+            icons = []
+        with cls._lock:
             cls._name2id.clear()
-            cls._icons.clear()
-        del cls._tryton_icons[:]
+            cls._name2id.update((n, i) for i, n in icons)
+            cls._unknown.clear()
+            if not refresh:
+                # Keep only the entries of the same record
+                cls._index.update(
+                    (n, e) for n, e in index.items()
+                    if isinstance(e, dict)
+                    and cls._name2id.get(n) == e.get('id'))
+            entries = dict(cls._index)
+        if not refresh:
+            threading.Thread(
+                target=cls._synchronize, args=(index_path, entries),
+                daemon=True).start()
 
+    @classmethod
+    def _synchronize(cls, index_path, entries):
+        "Revalidate the stored icons and read the missing ones"
+        if entries:
+            cls._revalidate(index_path, entries)
+        with cls._lock:
+            missing = [n for n in cls._name2id if n not in cls._index]
+        if missing:
+            cls._fetch_icons(missing)
+
+    @classmethod
+    def _revalidate(cls, index_path, entries):
+        "Drop the entries of the icons modified since they were stored"
         try:
-            icons = rpc.execute('model', 'ir.ui.icon', 'list_icons',
-                rpc.CONTEXT)
+            icons = rpc.execute(
+                'model', 'ir.ui.icon', 'read',
+                [e['id'] for e in entries.values()],
+                ['name', 'create_date', 'write_date'], rpc.CONTEXT)
         except TrytonServerError:
-            icons = []
-        for icon_id, icon_name in icons:
-            if refresh and icon_name in cls._icons:
-                continue
-            cls._tryton_icons.append((icon_id, icon_name))
-            cls._name2id[icon_name] = icon_id
+            return
+        if index_path != cls._index_path():
+            # The session has changed
+            return
+        timestamps = {i['name']: cls._timestamp(i) for i in icons}
+        with cls._lock:
+            changed = {
+                n for n, e in entries.items()
+                if timestamps.get(n) != e.get('timestamp')
+                and cls._index.get(n) == e}
+            for name in changed:
+                del cls._index[name]
+                cls._icons.pop(name, None)
+            for key in list(cls._pixbufs):
+                if key[0] in changed:
+                    del cls._pixbufs[key]
+            digests = {entries[n]['digest'] for n in changed} - {
+                e['digest'] for e in cls._index.values()}
+        if changed:
+            cls._save_index(index_path)
+            cls._remove_files(digests)
+
+    @classmethod
+    def _remove_files(cls, digests):
+        "Remove the icons and pixbufs stored for the digests"
+        try:
+            filenames = os.listdir(cls._path())
+        except OSError:
+            return
+        for filename in filenames:
+            if filename.split('.', 1)[0].split('-', 1)[0] in digests:
+                try:
+                    os.remove(cls._path(filename))
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _timestamp(icon):
+        return str(icon['write_date'] or icon['create_date'])
+
+    @classmethod
+    def _fetch_icons(cls, names):
+        "Read the icons from the server in one call and store them on disk"
+        index_path = cls._index_path()
+        with cls._lock:
+            ids = [cls._name2id[n] for n in names if n in cls._name2id]
+        try:
+            icons = rpc.execute(
+                'model', 'ir.ui.icon', 'read', ids,
+                ['name', 'icon', 'create_date', 'write_date'], rpc.CONTEXT)
+        except TrytonServerError:
+            return
+        if index_path != cls._index_path():
+            # The session has changed
+            return
+        entries, datas = {}, {}
+        for icon in icons:
+            data = icon['icon'].encode('utf-8')
+            digest = hashlib.sha1(data).hexdigest()
+            path = cls._path(digest + '.svg')
+            try:
+                if not os.path.exists(path):
+                    cls._write(path, data)
+            except OSError:
+                logger.warning("Unable to store icon %s", icon['name'])
+            datas[icon['name']] = data
+            entries[icon['name']] = {
+                'id': icon['id'],
+                'digest': digest,
+                'timestamp': cls._timestamp(icon),
+                }
+        with cls._lock:
+            cls._icons.update(datas)
+            cls._index.update(entries)
+        cls._save_index(index_path)
+
+    @classmethod
+    def _digest(cls, iconname):
+        with cls._lock:
+            return cls._index.get(iconname, {}).get('digest')
 
     @classmethod
     def register_icon(cls, iconname):
         # iconname might be '' when page do not define icon
         if (not iconname
                 or iconname in cls._icons
-                or iconname in cls._local_icons):
+                or iconname in cls._local_icons
+                or iconname in cls._unknown):
             return
         if iconname not in cls._name2id:
             cls.load_icons(refresh=True)
-        try:
-            icon_ref = (cls._name2id[iconname], iconname)
-        except KeyError:
-            return
-        idx = cls._tryton_icons.index(icon_ref)
-        to_load = slice(max(0, idx - cls.batchnum // 2),
-            idx + cls.batchnum // 2)
-        ids = [e[0] for e in cls._tryton_icons[to_load]]
-        try:
-            icons = rpc.execute('model', 'ir.ui.icon', 'read', ids,
-                ['name', 'icon'], rpc.CONTEXT)
-        except TrytonServerError:
-            icons = []
-        for icon in icons:
-            name = icon['name']
-            data = icon['icon'].encode('utf-8')
-            cls._icons[name] = data
-            cls._tryton_icons.remove((icon['id'], icon['name']))
-            del cls._name2id[icon['name']]
+            if iconname not in cls._name2id:
+                cls._unknown.add(iconname)
+                return
+        digest = cls._digest(iconname)
+        if digest:
+            try:
+                with open(cls._path(digest + '.svg'), 'rb') as fp:
+                    cls._icons[iconname] = fp.read()
+                return
+            except OSError:
+                pass
+        # Read also the next missing icons like the menu needs them
+        with cls._lock:
+            names = list(cls._name2id)
+            names = [n for n in names[names.index(iconname):]
+                if n == iconname or n not in cls._index]
+        cls._fetch_icons(names[:cls.batchnum])
 
     @classmethod
     def get_pixbuf(cls, iconname, size=16, color=None, badge=None):
         if not iconname:
             return
         colors = CONFIG['icon.colors'].split(',')
-        cls.register_icon(iconname)
-        if iconname not in cls._pixbufs[(size, badge)]:
-            if iconname in cls._icons:
-                data = cls._icons[iconname]
-            elif iconname in cls._local_icons:
-                path = cls._local_icons[iconname]
-                with open(path, 'rb') as fp:
-                    data = fp.read()
-            else:
-                logger.error("Unknown icon %s" % iconname)
-                return
-            if not color:
-                color = colors[0]
+        if not color:
+            color = colors[0]
+        if badge and not isinstance(badge, str):
             try:
-                ET.register_namespace('', 'http://www.w3.org/2000/svg')
-                root = ET.fromstring(data)
-                # If the color is set on the icon, we get it otherwise we take
-                # the color defined by default
-                if not root.attrib.get('fill'):
-                    root.attrib['fill'] = color
-                if badge:
-                    if not isinstance(badge, str):
-                        try:
-                            badge = colors[badge]
-                        except IndexError:
-                            badge = color
-                    ET.SubElement(root, 'circle', {
-                            'cx': '20',
-                            'cy': '4',
-                            'r': '4',
-                            'fill': badge,
-                            })
-                data = ET.tostring(root)
-            except ET.ParseError:
-                pass
-            width = height = {
-                Gtk.IconSize.MENU: 16,
-                Gtk.IconSize.SMALL_TOOLBAR: 16,
-                Gtk.IconSize.LARGE_TOOLBAR: 24,
-                Gtk.IconSize.BUTTON: 16,
-                Gtk.IconSize.DND: 12,
-                Gtk.IconSize.DIALOG: 48,
-                }.get(size, size)
-            pixbuf = data2pixbuf(data, width, height)
-            cls._pixbufs[(size, badge)][iconname] = pixbuf
-        return cls._pixbufs[(size, badge)][iconname]
+                badge = colors[badge]
+            except IndexError:
+                badge = color
+        key = (iconname, size, color, badge or '')
+        with cls._lock:
+            if key in cls._pixbufs:
+                return cls._pixbufs[key]
+        cls.register_icon(iconname)
+        if iconname in cls._icons:
+            data = cls._icons[iconname]
+        elif iconname in cls._local_icons:
+            path = cls._local_icons[iconname]
+            with open(path, 'rb') as fp:
+                data = fp.read()
+        else:
+            logger.error("Unknown icon %s" % iconname)
+            return
+        width = height = {
+            Gtk.IconSize.MENU: 16,
+            Gtk.IconSize.SMALL_TOOLBAR: 16,
+            Gtk.IconSize.LARGE_TOOLBAR: 24,
+            Gtk.IconSize.BUTTON: 16,
+            Gtk.IconSize.DND: 12,
+            Gtk.IconSize.DIALOG: 48,
+            }.get(size, size)
+        digest = cls._digest(iconname) or hashlib.sha1(data).hexdigest()
+        path = cls._path(quote(
+                '%s-%s-%s-%s.png' % (digest, width, color, badge or ''),
+                safe=''))
+        try:
+            pixbuf = GdkPixbuf.Pixbuf.new_from_file(path)
+        except GLib.GError:
+            pixbuf = cls._render(data, width, height, color, badge)
+            if pixbuf:
+                cls._save_pixbuf(pixbuf, path)
+        with cls._lock:
+            cls._pixbufs[key] = pixbuf
+        return pixbuf
+
+    @classmethod
+    def _render(cls, data, width, height, color, badge):
+        try:
+            ET.register_namespace('', 'http://www.w3.org/2000/svg')
+            root = ET.fromstring(data)
+            # If the color is set on the icon, we get it otherwise we take
+            # the color defined by default
+            if not root.attrib.get('fill'):
+                root.attrib['fill'] = color
+            if badge:
+                ET.SubElement(root, 'circle', {
+                        'cx': '20',
+                        'cy': '4',
+                        'r': '4',
+                        'fill': badge,
+                        })
+            data = ET.tostring(root)
+        except ET.ParseError:
+            pass
+        return data2pixbuf(data, width, height)
+
+    @staticmethod
+    def _save_pixbuf(pixbuf, path):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            os.close(fd)
+            pixbuf.savev(tmp, 'png', [], [])
+            os.replace(tmp, path)
+        except (OSError, GLib.GError):
+            logger.warning("Unable to store pixbuf %s", path)
 
     @classmethod
     def get_image(cls, iconname, size=16, color=None, badge=None):
@@ -200,112 +386,248 @@ class IconFactory:
         return urllib.parse.urlunsplit(parts)
 
     @classmethod
-    @lru_cache(maxsize=CONFIG['image.cache_size'])
-    def get_pixbuf_url(cls, url, size=16, size_param=None):
+    def _get_url_loader(cls):
+        if cls._url_loader is None:
+            cls._url_loader = ImageLoader(
+                path=os.path.join(get_config_dir(), 'images'),
+                workers=int(CONFIG['image.workers']))
+        return cls._url_loader
+
+    @classmethod
+    def _set_url_pixbuf(cls, key, data):
+        url, size = key
+        if data is None:
+            # Do not cache the failure to fetch it again later
+            cls._url_failures[key] = (
+                time.time() + int(CONFIG['image.retry_delay']))
+            return
+        cls._url_failures.pop(key, None)
+        pixbuf = data2pixbuf(data, size, size)
+        cls._url_pixbufs[key] = pixbuf
+        while len(cls._url_pixbufs) > int(CONFIG['image.cache_size']):
+            cls._url_pixbufs.popitem(last=False)
+        return pixbuf
+
+    @classmethod
+    def _placeholder(cls, size):
+        if size not in cls._placeholders:
+            pixbuf = GdkPixbuf.Pixbuf.new(
+                GdkPixbuf.Colorspace.RGB, True, 8, size, size)
+            pixbuf.fill(0)
+            cls._placeholders[size] = pixbuf
+        return cls._placeholders[size]
+
+    @classmethod
+    def get_pixbuf_url(cls, url, size=16, size_param=None, callback=None):
+        """Return the pixbuf of the image at url.
+        If callback is set, the image is fetched in background and a
+        placeholder is returned until callback is called."""
         if not url:
             return
         url = cls._convert_url(url, size, size_param=size_param)
-        try:
-            with urllib.request.urlopen(url) as response:
-                return data2pixbuf(response.read(), size, size)
-        except urllib.error.URLError:
-            logger.info("Can not fetch %s", url, exc_info=True)
+        key = (url, size)
+        if key in cls._url_pixbufs:
+            cls._url_pixbufs.move_to_end(key)
+            return cls._url_pixbufs[key]
+        if cls._url_failures.get(key, 0) > time.time():
+            return
+        if callback is None:
+            try:
+                data = cls._get_url_loader().fetch(url)
+            except (urllib.error.URLError, OSError):
+                logger.info("Can not fetch %s", url, exc_info=True)
+                data = None
+            return cls._set_url_pixbuf(key, data)
+
+        callbacks = cls._url_callbacks.setdefault(key, [])
+        if callback not in callbacks:
+            callbacks.append(callback)
+        if len(callbacks) == 1:
+            cls._get_url_loader().load(
+                url, lambda data: GLib.idle_add(cls._url_loaded, key, data))
+        return cls._placeholder(size)
+
+    @classmethod
+    def _url_loaded(cls, key, data):
+        cls._set_url_pixbuf(key, data)
+        for callback in cls._url_callbacks.pop(key, []):
+            callback()
 
 
 IconFactory.load_local_icons()
 
 
-class ModelAccess(object):
+class ModelStore:
+    "Store the metadata of the models loaded in one round-trip"
+    _data = {}
+    _methods = {
+        'models': 'list_models',
+        'history': 'list_history',
+        'names': 'get_names',
+        'notification': 'get_notification',
+        }
+    _defaults = {
+        'models': [],
+        'history': [],
+        'names': {},
+        'notification': {},
+        }
 
-    batchnum = 100
-    _access = {}
-    _models = []
+    def _path(self):
+        return os.path.join(get_config_dir(), 'models', quote(
+                '%s/%s/%s.json' % (
+                    CONFIG['login.host'], CONFIG['login.db'], rpc._USER),
+                safe=''))
+
+    @staticmethod
+    def _normalize(data):
+        if 'history' in data:
+            data['history'] = set(data['history'])
+        return data
+
+    def load(self):
+        """Load the metadata from the disk snapshot and refresh it in
+        background or from the server if there is no snapshot of the same
+        server version"""
+        path = self._path()
+        try:
+            with open(path, 'r') as fp:
+                snapshot = json.load(fp)
+        except (OSError, ValueError):
+            snapshot = {}
+        if snapshot.get('language') != rpc.CONTEXT.get('language'):
+            snapshot.pop('names', None)
+        version = None
+        if snapshot.get('access'):
+            try:
+                version = rpc.execute('common', 'server', 'version')
+            except TrytonServerError:
+                pass
+            if version != snapshot.get('version'):
+                # The server may have been upgraded
+                snapshot = {}
+        if snapshot.get('access'):
+            self._data = self._normalize(snapshot)
+            threading.Thread(
+                target=self._fetch,
+                args=(path, list(snapshot['access']), version),
+                daemon=True).start()
+        else:
+            self._data = {}
+            self._fetch(path, version=version)
+
+    def _fetch(self, path, models=None, version=None):
+        data = {
+            'language': rpc.CONTEXT.get('language'),
+            'version': version,
+            }
+        with rpc.batch() as batch:
+            calls = {}
+            if version is None:
+                calls['version'] = batch.execute(
+                    'common', 'server', 'version')
+            for key, method in self._methods.items():
+                calls[key] = batch.execute(
+                    'model', 'ir.model', method, rpc.CONTEXT)
+            if models:
+                calls['access'] = batch.execute(
+                    'model', 'ir.model.access', 'get_access', models,
+                    rpc.CONTEXT)
+        for key, call in calls.items():
+            try:
+                data[key] = call.result()
+            except Exception:
+                logger.warning("Unable to load %s of models", key,
+                    exc_info=True)
+                return
+        missing = set(data['models']) - set(data.get('access', {}))
+        if missing:
+            try:
+                data.setdefault('access', {}).update(rpc.execute(
+                        'model', 'ir.model.access', 'get_access',
+                        sorted(missing), rpc.CONTEXT))
+            except Exception:
+                logger.warning("Unable to load access of models",
+                    exc_info=True)
+                return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(data, fp)
+            os.replace(tmp, path)
+        except OSError:
+            logger.warning("Unable to store metadata of models")
+        if path == self._path():
+            self._data = self._normalize(data)
 
-    def load_models(self, refresh=False):
-        if not refresh:
-            self._access.clear()
-        del self._models[:]
+    def get(self, key):
+        "Return the metadata of key and fetch it if missing"
+        if key not in self._data:
+            try:
+                value = rpc.execute(
+                    'model', 'ir.model', self._methods[key], rpc.CONTEXT)
+            except TrytonServerError:
+                value = self._defaults[key]
+            self._data[key] = value
+            self._normalize(self._data)
+        return self._data[key]
+
+    def access(self, model):
+        access = self._data.setdefault('access', {})
+        if model not in access:
+            # The model is unknown from the last load
+            try:
+                access.update(rpc.execute('model', 'ir.model.access',
+                        'get_access', [model], rpc.CONTEXT))
+            except TrytonServerError:
+                pass
+        return access[model]
 
-        try:
-            self._models = rpc.execute('model', 'ir.model', 'list_models',
-                rpc.CONTEXT)
-        except TrytonServerError:
-            pass
+    def clear(self, key=None):
+        if key:
+            self._data.pop(key, None)
+        else:
+            self._data = {}
+
+
+MODELSTORE = ModelStore()
+
+
+class ModelAccess(object):
 
     def __getitem__(self, model):
-        if model in self._access:
-            return self._access[model]
-        if model not in self._models:
-            self.load_models(refresh=True)
-        idx = self._models.index(model)
-        to_load = slice(max(0, idx - self.batchnum // 2),
-            idx + self.batchnum // 2)
-        try:
-            access = rpc.execute('model', 'ir.model.access', 'get_access',
-                self._models[to_load], rpc.CONTEXT)
-        except TrytonServerError:
-            access = {}
-        self._access.update(access)
-        return self._access[model]
+        return MODELSTORE.access(model)
 
 
 MODELACCESS = ModelAccess()
 
 
 class ModelHistory(object):
-    _models = set()
-
-    def load_history(self):
-        self._models.clear()
-        try:
-            self._models.update(rpc.execute('model', 'ir.model',
-                    'list_history', rpc.CONTEXT))
-        except TrytonServerError:
-            pass
 
     def __contains__(self, model):
-        return model in self._models
+        return model in MODELSTORE.get('history')
 
 
 MODELHISTORY = ModelHistory()
 
 
 class ModelName:
-    _names = {}
-
-    def load_names(self):
-        try:
-            self._names = rpc.execute(
-                'model', 'ir.model', 'get_names', rpc.CONTEXT)
-        except TrytonServerError:
-            pass
 
     def get(self, model):
-        if not self._names:
-            self.load_names()
-        return self._names.get(model, '')
+        return MODELSTORE.get('names').get(model, '')
 
     def clear(self):
-        return self._names.clear()
+        return MODELSTORE.clear('names')
 
 
 MODELNAME = ModelName()
 
 
 class ModelNotification:
-    _depends = None
-
-    def load_names(self):
-        try:
-            self._depends = rpc.execute(
-                'model', 'ir.model', 'get_notification', rpc.CONTEXT)
-        except TrytonServerError:
-            pass
 
     def get(self, model):
-        if self._depends is None:
-            self.load_names()
-        return self._depends.get(model, [])
+        return MODELSTORE.get('notification').get(model, [])
 
 
 MODELNOTIFICATION = ModelNotification()
@@ -1130,6 +1452,12 @@ class Logout:
             pass
 
 
+@lru_cache(maxsize=128)
+def parse_arch(arch):
+    "Return the DOM of the view arch which must not be modified"
+    return xml.dom.minidom.parseString(arch)
+
+
 def node_attributes(node):
     result = {}
     attrs = node.attributes
@@ -1196,8 +1524,12 @@ class RPCProgress(object):
         self.exception = None
 
     def start(self):
+        self.done(lambda: getattr(rpc, self.method)(*self.args))
+        return True
+
+    def done(self, result):
         try:
-            self.res = getattr(rpc, self.method)(*self.args)
+            self.res = result()
         except Exception as exception:
             self.error = True
             self.res = False
@@ -1208,7 +1540,6 @@ class RPCProgress(object):
         if self.callback:
             # Post to GTK queue to be run by the main thread
             GLib.idle_add(self.process)
-        return True
 
     def run(self, process_exception_p=True, callback=None):
         self.process_exception_p = process_exception_p
@@ -1224,7 +1555,10 @@ class RPCProgress(object):
                 watch = Gdk.Cursor.new_for_display(
                     display, Gdk.CursorType.WATCH)
                 window.set_cursor(watch)
-            _thread.start_new_thread(self.start, ())
+            if self.method == 'execute' and CONFIG['client.batch_rpc']:
+                RPC_BATCH.add(self)
+            else:
+                _thread.start_new_thread(self.start, ())
             return
         else:
             self.start()
@@ -1256,6 +1590,36 @@ class RPCProgress(object):
             return return_()
 
 
+class RPCBatch(object):
+    "Send the asynchronous calls of a main loop iteration in one round-trip"
+
+    def __init__(self):
+        self._lock = Lock()
+        self._pending = []
+
+    def add(self, progress):
+        with self._lock:
+            self._pending.append(progress)
+            if len(self._pending) == 1:
+                GLib.idle_add(self.flush)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        _thread.start_new_thread(self.send, (pending,))
+        return False
+
+    def send(self, pending):
+        batch = rpc.Batch()
+        calls = [batch.execute(*p.args) for p in pending]
+        batch.send()
+        for progress, call in zip(pending, calls):
+            progress.done(call.result)
+
+
+RPC_BATCH = RPCBatch()
+
+
 def RPCExecute(*args, **kwargs):
     rpc_context = rpc.CONTEXT.copy()
     if kwargs.get('context'):
@@ -1428,7 +1792,12 @@ def _data2pixbuf(data, width=None, height=None):
     loader = GdkPixbuf.PixbufLoader()
     if width and height:
         loader.set_size(width, height)
-    loader.write(data)
+    if isinstance(data, memoryview):
+        # Feed mapped data by chunks instead of copying it at once
+        for i in range(0, len(data), 1 << 16):
+            loader.write(data[i:i + (1 << 16)].tobytes())
+    else:
+        loader.write(data)
     loader.close()
     return loader.get_pixbuf()
 
@@ -1,7 +1,10 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 import gettext
+import json
 import logging
+import time
+from collections import OrderedDict, defaultdict
 
 from gi.repository import GLib, Gtk
 
@@ -9,6 +12,7 @@ from tryton.common import RPCExecute
 from tryton.common.domain_parser import likify
 from tryton.config import CONFIG
 from tryton.exceptions import TrytonError, TrytonServerError
+from tryton.jsonrpc import JSONEncoder
 
 _ = gettext.gettext
 logger = logging.getLogger(__name__)
@@ -28,8 +32,100 @@ def get_completion(search=True, create=True):
     return completion
 
 
+class CompletionCache:
+    "Cache the completion results by model, domain, context and text"
+    size = 256
+    duration = 60
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._stats = defaultdict(int)
+
+    @staticmethod
+    def key(model, domain, context, order, limit, text):
+        params = json.dumps(
+            [domain, context, order, limit], cls=JSONEncoder, sort_keys=True)
+        return model, params, text
+
+    def get(self, key):
+        "Return the cached results for key or None"
+        entry = self._entries.get(key)
+        if entry and time.monotonic() - entry[0] < self.duration:
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[1]
+        self._stats['misses'] += 1
+
+    def set(self, key, results):
+        self._entries[key] = (time.monotonic(), results)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, model):
+        "Remove the results of the model"
+        for key in [k for k in self._entries if k[0] == model]:
+            del self._entries[key]
+            self._stats['invalidations'] += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def search(self, key, domain, order, context, limit, callback):
+        "Search for key and call callback with the results"
+        if key in self._pending:
+            self._pending[key].append(callback)
+            return
+        self._pending[key] = [callback]
+        model = key[0]
+
+        def searched(results):
+            try:
+                results = results()
+            except (TrytonError, TrytonServerError):
+                results = None
+            if results is not None:
+                self.set(key, results)
+            for callback in self._pending.pop(key, []):
+                callback(results or [])
+        try:
+            RPCExecute('model', model, 'search_read', domain, 0, limit,
+                order, ['rec_name'], context=context,
+                process_exception=False, callback=searched)
+        except Exception:
+            del self._pending[key]
+            logger.warning(
+                "Unable to search for completion of %s", model,
+                exc_info=True)
+
+    def cancelled(self):
+        self._stats['cancelled'] += 1
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats['entries'] = len(self._entries)
+        stats['pending'] = len(self._pending)
+        requests = self._stats['hits'] + self._stats['misses']
+        stats['hit_rate'] = (
+            self._stats['hits'] / requests if requests else 0)
+        return stats
+
+
+CACHE = CompletionCache()
+
+
 def update_completion(entry, record, field, model, domain=None):
     "Update entry completion"
+    def fill(search_text, results):
+        completion_model = entry.get_completion().get_model()
+        completion_model.clear()
+        for result in results:
+            completion_model.append([result['rec_name'], result['id']])
+        completion_model.search_text = search_text
+        # Force display of popup
+        entry.emit('changed')
+
     def update(search_text, domain):
         if not entry.props.window:
             return False
@@ -45,30 +141,22 @@ def update_completion(entry, record, field, model, domain=None):
         if domain is None:
             domain = field.domain_get(record)
         context = field.get_search_context(record)
-        domain = [('rec_name', 'ilike', likify(search_text)), domain]
         order = field.get_search_order(record)
+        limit = CONFIG['client.limit']
+        key = CACHE.key(model, domain, context, order, limit, search_text)
+        results = CACHE.get(key)
+        if results is not None:
+            fill(search_text, results)
+            return False
 
         def callback(results):
-            try:
-                results = results()
-            except (TrytonError, TrytonServerError):
-                results = []
             if search_text != entry.get_text():
-                return False
-            completion_model.clear()
-            for result in results:
-                completion_model.append([result['rec_name'], result['id']])
-            completion_model.search_text = search_text
-            # Force display of popup
-            entry.emit('changed')
-        try:
-            RPCExecute('model', model, 'search_read', domain, 0,
-                CONFIG['client.limit'], order, ['rec_name'], context=context,
-                process_exception=False, callback=callback)
-        except Exception:
-            logger.warning(
-                "Unable to search for completion of %s", model,
-                exc_info=True)
+                CACHE.cancelled()
+                return
+            fill(search_text, results)
+        CACHE.search(
+            key, [('rec_name', 'ilike', likify(search_text)), domain],
+            order, context, limit, callback)
         return False
     search_text = entry.get_text()
     GLib.timeout_add(300, update, search_text, domain)
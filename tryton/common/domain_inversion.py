@@ -1,10 +1,11 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 
+import copy
 import datetime
 import operator
 import re
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from functools import partial, reduce
 
 
@@ -405,27 +406,96 @@ def parse(domain):
         return And(domain[1:] if domain[0] == 'AND' else domain)
 
 
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(map(_freeze, value))
+    elif isinstance(value, str) or value is None:
+        return value
+    # Keep the type as True == 1 == 1.0 == Decimal(1)
+    return (value.__class__, value)
+
+
+_compiled = OrderedDict()
+_compiled_size = 1024
+
+
+def compile_domain(domain):
+    "Return the parsed expression of the domain from the cache"
+    key = repr(domain)
+    if ' at 0x' in key:
+        # The representation does not depend only on the value
+        return parse(domain)
+    try:
+        expression = _compiled[key]
+    except KeyError:
+        # Copy the domain as it is kept by the cache
+        expression = _compiled[key] = parse(copy.deepcopy(domain))
+        if len(_compiled) > _compiled_size:
+            _compiled.popitem(last=False)
+    else:
+        _compiled.move_to_end(key)
+    return expression
+
+
 def domain_inversion(domain, symbol, context=None):
     """compute an inversion of the domain eventually the context is used to
     simplify the expression"""
     if context is None:
         context = {}
-    expression = parse(domain)
+    expression = compile_domain(domain)
     if symbol not in expression.variables:
         return True
-    return expression.inverse(symbol, context)
+    if not isinstance(expression, And):
+        return expression.inverse(symbol, context)
+    try:
+        key = symbol, expression.context_key(symbol, context)
+        return expression.inversions[key]
+    except TypeError:
+        return expression.inverse(symbol, context)
+    except KeyError:
+        pass
+    if len(expression.inversions) >= expression.inversions_size:
+        expression.inversions.clear()
+    result = expression.inversions[key] = expression.inverse(symbol, context)
+    return result
 
 
 class And(object):
+    inversions_size = 128
 
     def __init__(self, expressions):
         self.branches = list(map(parse, expressions))
         self.variables = set()
+        # The base variable of the leaf branches or None
+        self.bases = []
+        # The field names of the leaves with their base
+        self.names = set()
         for expression in self.branches:
+            base = None
             if is_leaf(expression):
-                self.variables.add(self.base(expression[0]))
+                base = self.base(expression[0])
+                self.variables.add(base)
+                self.names.add((expression[0], base))
             elif isinstance(expression, And):
                 self.variables |= expression.variables
+                self.names.update(expression.names)
+            self.bases.append(base)
+        self.names = tuple(sorted(self.names))
+        self._depends = {}
+        self._constants = {}
+        # The inversions by symbol and context key
+        self.inversions = {}
+
+    def context_key(self, symbol, context):
+        """Return the values of the context used by the inversion for
+        symbol. Raise TypeError if a value is not hashable."""
+        keys = context.keys()
+        key = tuple(
+            (name in context, base in context, base in keys,
+                _freeze(context.get(base)))
+            for name, base in self.names if base != symbol)
+        hash(key)
+        return key
 
     def base(self, expression):
         if '.' not in expression:
@@ -433,21 +503,44 @@ class And(object):
         else:
             return expression.split('.')[0]
 
+    def depends(self, symbol):
+        "Test if the inversion for symbol depends on the context"
+        if symbol not in self._depends:
+            self._depends[symbol] = self._depends_on(symbol)
+        return self._depends[symbol]
+
+    def _depends_on(self, symbol):
+        for part, base in zip(self.branches, self.bases):
+            if isinstance(part, And):
+                if symbol in part.variables and part.depends(symbol):
+                    return True
+            elif base != symbol:
+                return True
+        return False
+
     def inverse(self, symbol, context):
+        if symbol in self._constants:
+            return self._constants[symbol]
+        result = self._inverse(symbol, context)
+        if not self.depends(symbol):
+            self._constants[symbol] = result
+        return result
+
+    def _inverse(self, symbol, context):
         result = []
-        for part in self.branches:
+        for part, base in zip(self.branches, self.bases):
             if isinstance(part, And):
-                part_inversion = part.inverse(symbol, context)
-                evaluated = isinstance(part_inversion, bool)
                 if symbol not in part.variables:
                     continue
+                part_inversion = part.inverse(symbol, context)
+                evaluated = isinstance(part_inversion, bool)
                 if not evaluated:
                     result.append(part_inversion)
                 elif part_inversion:
                     continue
                 else:
                     return False
-            elif is_leaf(part) and self.base(part[0]) == symbol:
+            elif base == symbol:
                 result.append(part)
             else:
                 field = part[0]
@@ -468,15 +561,27 @@ class And(object):
 
 class Or(And):
 
-    def inverse(self, symbol, context):
+    def _depends_on(self, symbol):
+        if self.variables - {symbol}:
+            return True
+        for part, base in zip(self.branches, self.bases):
+            if isinstance(part, And):
+                if part.depends(symbol):
+                    return True
+            elif base != symbol:
+                return True
+        return False
+
+    def _inverse(self, symbol, context):
         result = []
-        known_variables = set(context.keys())
-        if not known_variables >= (self.variables - {symbol}):
+        known_variables = context.keys()
+        if not all(v in known_variables
+                for v in self.variables if v != symbol):
             # In this case we don't know enough about this OR part, we
             # consider it to be True (because people will have the constraint
             # on this part later).
             return True
-        for part in self.branches:
+        for part, base in zip(self.branches, self.bases):
             if isinstance(part, And):
                 part_inversion = part.inverse(symbol, context)
                 evaluated = isinstance(part_inversion, bool)
@@ -490,7 +595,7 @@ class Or(And):
                     return True
                 else:
                     continue
-            elif is_leaf(part) and self.base(part[0]) == symbol:
+            elif base == symbol:
                 result.append(part)
             else:
                 field = part[0]
@@ -17,7 +17,7 @@ class EvalEnvironment(dict):
             return EvalEnvironment(self.parent.parent,
                 eval_type=self.eval_type)
         if self.eval_type == 'eval':
-            return self.parent.get_eval()[item]
+            return self.parent.eval_snapshot()[item]
         else:
             return self.parent.group.fields[item].get_on_change_value(
                 self.parent)
@@ -49,12 +49,12 @@ class EvalEnvironment(dict):
         if item == '_parent_' + self.parent.parent_name and self.parent.parent:
             return True
         if self.eval_type == 'eval':
-            return item in self.parent.get_eval()
+            return item in self.parent.eval_snapshot()
         else:
             return item in self.parent.group.fields
 
     def keys(self):
         if self.eval_type == 'eval':
-            return self.parent.get_eval().keys()
+            return self.parent.eval_snapshot().keys()
         else:
             return self.parent.group.fields.keys()
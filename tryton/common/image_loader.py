@@ -0,0 +1,160 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import email.utils
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+__all__ = ['ImageLoader']
+
+logger = logging.getLogger(__name__)
+
+_MAX_AGE = re.compile(r'(?:^|,)\s*(?:s-)?max-age\s*=\s*"?(\d+)"?', re.I)
+
+
+class ImageLoader:
+    "Fetch the data of URL by worker threads with a disk cache"
+
+    def __init__(self, path=None, workers=4, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='image_loader')
+        self._pending = {}
+        self._lock = Lock()
+
+    def load(self, url, callback):
+        """Fetch url in a worker thread and call callback with the data
+        or None on failure. Concurrent loads of the same url share the
+        same request."""
+        with self._lock:
+            if url in self._pending:
+                self._pending[url].append(callback)
+                return
+            self._pending[url] = [callback]
+        self._executor.submit(self._load, url)
+
+    def _load(self, url):
+        try:
+            data = self.fetch(url)
+        except Exception:
+            logger.info("Can not fetch %s", url, exc_info=True)
+            data = None
+        with self._lock:
+            callbacks = self._pending.pop(url)
+        for callback in callbacks:
+            callback(data)
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _filenames(self, url):
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return (
+            os.path.join(self.path, digest),
+            os.path.join(self.path, digest + '.json'))
+
+    def _read(self, url):
+        if not self.path:
+            return None, {}
+        data_path, meta_path = self._filenames(url)
+        try:
+            with open(meta_path, 'r') as fp:
+                meta = json.load(fp)
+            with open(data_path, 'rb') as fp:
+                return fp.read(), meta
+        except (OSError, ValueError):
+            return None, {}
+
+    def _write(self, url, data, meta):
+        if not self.path:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        for path, content in zip(self._filenames(url), [
+                    data, json.dumps(meta).encode('utf-8')]):
+            fd, tmp = tempfile.mkstemp(dir=self.path)
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(content)
+            os.replace(tmp, path)
+
+    def _remove(self, url):
+        if not self.path:
+            return
+        for path in self._filenames(url):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _meta(headers):
+        "Return the cache metadata from the response headers or None"
+        cache_control = headers.get('Cache-Control', '').lower()
+        if 'no-store' in cache_control:
+            return None
+        now = time.time()
+        match = _MAX_AGE.search(cache_control)
+        if 'no-cache' in cache_control:
+            expires = now
+        elif match:
+            expires = now + int(match.group(1))
+        elif headers.get('Expires'):
+            try:
+                expires = email.utils.parsedate_to_datetime(
+                    headers['Expires']).timestamp()
+            except (TypeError, ValueError):
+                expires = now
+        else:
+            expires = now
+        return {
+            'expires': expires,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            }
+
+    def fetch(self, url):
+        "Return the data of url from the disk cache or the network"
+        data, meta = self._read(url)
+        if data is not None and meta.get('expires', 0) > time.time():
+            return data
+        request = urllib.request.Request(url)
+        if data is not None:
+            if meta.get('etag'):
+                request.add_header('If-None-Match', meta['etag'])
+            if meta.get('last_modified'):
+                request.add_header('If-Modified-Since', meta['last_modified'])
+        try:
+            with urllib.request.urlopen(
+                    request, timeout=self.timeout) as response:
+                content = response.read()
+                headers = response.headers
+        except urllib.error.HTTPError as exception:
+            if exception.code != 304 or data is None:
+                raise
+            content, headers = data, exception.headers
+            # A 304 response may omit the validators
+            for name, key in [
+                    ('ETag', 'etag'), ('Last-Modified', 'last_modified')]:
+                if not headers.get(name) and meta.get(key):
+                    headers[name] = meta[key]
+        meta = self._meta(headers)
+        try:
+            if meta is None:
+                self._remove(url)
+            else:
+                self._write(url, content, meta)
+        except OSError:
+            logger.warning("Unable to store %s", url, exc_info=True)
+        return content
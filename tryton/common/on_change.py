@@ -0,0 +1,97 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict, defaultdict
+
+from tryton.config import CONFIG
+from tryton.jsonrpc import JSONEncoder, object_hook
+
+__all__ = ['OnChangeCache', 'CACHE']
+
+logger = logging.getLogger(__name__)
+
+
+class OnChangeCache:
+    """Cache the results of the on_change calls by their arguments
+    Only the models or methods listed in client.on_change_cache are cached,
+    as "model" for all its methods or "model:method"."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._models = defaultdict(set)
+        self._enabled = (None, frozenset())
+        self._stats = defaultdict(int)
+
+    def enabled(self, model, method):
+        config = CONFIG['client.on_change_cache'] or ''
+        if self._enabled[0] != config:
+            self._enabled = (
+                config, frozenset(n for n in re.split(r'[\s,]+', config) if n))
+        names = self._enabled[1]
+        return model in names or '%s:%s' % (model, method) in names
+
+    @staticmethod
+    def key(model, method, values, params, context):
+        data = json.dumps(
+            [values, params, context], cls=JSONEncoder, sort_keys=True,
+            separators=(',', ':'))
+        return model, method, hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        "Return the cached result for key or raise KeyError"
+        entry = self._entries.get(key)
+        if entry is None:
+            self._stats['misses'] += 1
+            raise KeyError(key)
+        expire, data = entry
+        if expire < time.monotonic():
+            self._remove(key)
+            self._stats['expired'] += 1
+            self._stats['misses'] += 1
+            raise KeyError(key)
+        self._entries.move_to_end(key)
+        self._stats['hits'] += 1
+        logger.info('(cached) %s.%s', *key[:2])
+        # The result is stored dumped as the records modify it
+        return json.loads(data, object_hook=object_hook)
+
+    def set(self, key, result):
+        data = json.dumps(result, cls=JSONEncoder, separators=(',', ':'))
+        duration = int(CONFIG['client.on_change_cache_duration'])
+        self._entries[key] = (time.monotonic() + duration, data)
+        self._entries.move_to_end(key)
+        self._models[key[0]].add(key)
+        while len(self._entries) > int(CONFIG['client.on_change_cache_size']):
+            self._remove(next(iter(self._entries)))
+            self._stats['evictions'] += 1
+
+    def _remove(self, key):
+        del self._entries[key]
+        keys = self._models[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self._models[key[0]]
+
+    def invalidate(self, model):
+        "Remove the results of the model"
+        for key in self._models.pop(model, ()):
+            del self._entries[key]
+            self._stats['invalidations'] += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._models.clear()
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats['entries'] = len(self._entries)
+        requests = self._stats['hits'] + self._stats['misses']
+        stats['hit_rate'] = self._stats['hits'] / requests if requests else 0
+        return stats
+
+
+CACHE = OnChangeCache()
@@ -2,11 +2,20 @@
 # this repository contains the full copyright notices and license terms.
 import math
 import operator
+from collections import defaultdict
 
 from gi.repository import Gdk, GLib, GObject, Gtk
 
 from tryton.common import RPCException, RPCExecute, eval_domain
 
+# Generation of the records by model to invalidate the cached selections
+_generations = defaultdict(int)
+
+
+def invalidate(model):
+    "Invalidate the selections of the records of model"
+    _generations[model] += 1
+
 
 class SelectionMixin(object):
 
@@ -18,6 +27,7 @@ class SelectionMixin(object):
         self._last_domain = None
         self._values2selection = {}
         self._domain_cache = {}
+        self._generation = None
 
     def init_selection(self, value=None):
         if value is None:
@@ -59,6 +69,11 @@ class SelectionMixin(object):
             self.init_selection(value)
             self.filter_selection(domain, record, field)
         else:
+            generation = _generations[self.attrs['relation']]
+            if generation != self._generation:
+                self._domain_cache.clear()
+                self._last_domain = None
+                self._generation = generation
             context = field.get_context(record)
             domain_cache_key = (freeze_value(domain), freeze_value(context))
             if domain_cache_key in self._domain_cache:
@@ -64,12 +64,29 @@ class ConfigManager(object):
             'client.limit': 100,
             'client.check_version': False,
             'client.bus_timeout': 10 * 60,
+            'client.batch_rpc': False,
+            'client.prefetch_lazy': True,
+            'client.export_chunk': 1000,
+            'client.export_workers': 1,
+            'client.import_chunk': 1000,
+            'client.import_workers': 1,
+            'client.on_change_cache': '',
+            'client.on_change_cache_size': 1024,
+            'client.on_change_cache_duration': 5 * 60,
+            'client.tree_model': 'generic',
+            'connection.pool_min': 1,
+            'connection.pool_max': 16,
+            'connection.idle_timeout': 5 * 60,
+            'connection.cache_size': 64 * 1024 * 1024,
+            'connection.persistent_cache': True,
             'icon.colors': '#0094d2,#57a639,#cc0000',
             'tree.colors': '#777,#dff0d8,#fcf8e3,#f2dede',
             'calendar.colors': '#fff,#3465a4',
             'graph.color': '#3465a4',
             'image.max_size': 10 ** 6,
             'image.cache_size': 1024,
+            'image.workers': 4,
+            'image.retry_delay': 60,
             'bug.url': 'https://support.coopengo.com/',
             'download.url': 'https://downloads-cdn.tryton.org/',
             'download.frequency': 60 * 60 * 8,
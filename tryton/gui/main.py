@@ -549,9 +549,7 @@ class Main(Gtk.Application):
         threads = []
         for target in (
                 common.IconFactory.load_icons,
-                common.MODELACCESS.load_models,
-                common.MODELHISTORY.load_history,
-                common.MODELNOTIFICATION.load_names,
+                common.MODELSTORE.load,
                 common.VIEW_SEARCH.load_searches,
                 ):
             t = threading.Thread(target=target)
@@ -580,7 +578,6 @@ class Main(Gtk.Application):
                 self.favorite_unset()
                 self.primary_menu.set_menu_model(self._get_primary_menu())
             CONFIG['client.lang'] = prefs['language']
-        common.MODELNAME.clear()
         # Set placeholder after language is set to get correct translation
         self.global_search_entry.set_placeholder_text(_("Action"))
         CONFIG.save()
@@ -2,9 +2,8 @@
 # this repository contains the full copyright notices and license terms.
 "Board"
 import gettext
-import xml.dom.minidom
 
-from tryton.common import MODELNAME, RPCExecute
+from tryton.common import MODELNAME, RPCExecute, parse_arch
 from tryton.gui import Main
 from tryton.gui.window.view_board import ViewBoard
 
@@ -25,7 +24,7 @@ class Board(TabContent):
         view = RPCExecute(
             'model', 'ir.ui.view', 'view_get', self.view_id, context=context)
 
-        xml_dom = xml.dom.minidom.parseString(view['arch'])
+        xml_dom = parse_arch(view['arch'])
         root, = xml_dom.childNodes
         self.board = ViewBoard(root, context=context)
         self.model = model
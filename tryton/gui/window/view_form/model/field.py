@@ -1,11 +1,14 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import atexit
 import datetime
 import decimal
 import locale
 import logging
 import math
+import mmap
 import os
+import shutil
 import tempfile
 from decimal import Decimal
 from itertools import chain
@@ -41,10 +44,7 @@ class Field(object):
         self.views = set()
 
     def sig_changed(self, record):
-        record.on_change([self.name])
-        record.on_change_with([self.name])
-        record.autocomplete_with(self.name)
-        record.set_field_context()
+        record.changed([self.name])
 
     def domains_get(self, record, pre_validate=None):
         screen_domain = domain_inversion(
@@ -164,6 +164,7 @@ class Field(object):
 
     def set(self, record, value):
         record.value[self.name] = value
+        record.invalidate_eval([self.name])
 
     def get(self, record):
         return record.value.get(self.name, self._default)
@@ -198,7 +199,7 @@ class Field(object):
         self.set(record, value)
 
     def state_set(self, record, states=('readonly', 'required', 'invisible')):
-        state_changes = record.expr_eval(self.attrs.get('states', {}))
+        state_changes = record.get_states(self)
         for key in states:
             if key == 'readonly' and self.attrs.get(key, False):
                 continue
@@ -552,6 +553,7 @@ class M2OField(Field):
             rec_name = result['rec_name'] or ''
         record.value.setdefault(self.name + '.', {})['rec_name'] = rec_name
         record.value[self.name] = value
+        record.invalidate_eval([self.name])
 
     def get_context(self, record, record_context=None, local=False):
         context = super(M2OField, self).get_context(
@@ -747,6 +749,7 @@ class O2MField(Field):
         group.parent = None
         self._set_value(record, value, default=_default)
         group.parent = record
+        record.invalidate_eval([self.name])
 
     def set_client(self, record, value, force_change=False):
         # domain inversion could try to set None as value
@@ -760,6 +763,7 @@ class O2MField(Field):
         # The order of the ids is not significant
         modified = set(previous_ids) != set(value)
         self._set_value(record, value, modified=modified)
+        record.invalidate_eval([self.name])
         if modified:
             self.sig_changed(record)
             record.validate(softvalidation=True)
@@ -943,6 +947,7 @@ class ReferenceField(Field):
     def set(self, record, value):
         if not value:
             record.value[self.name] = self._default
+            record.invalidate_eval([self.name])
             return
         if isinstance(value, str):
             ref_model, ref_id = value.split(',')
@@ -970,6 +975,7 @@ class ReferenceField(Field):
             rec_name = str(ref_id) if ref_id is not None else ''
         record.value[self.name] = ref_model, ref_id
         record.value.setdefault(self.name + '.', {})['rec_name'] = rec_name
+        record.invalidate_eval([self.name])
 
     def get_context(self, record, record_context=None, local=False):
         context = super(ReferenceField, self).get_context(
@@ -1027,15 +1033,56 @@ class ReferenceField(Field):
             concat(screen_domain, attr_domain), self.name)
 
 
+def _remove_files():
+    "Remove the cache files which were still in use when released"
+    for path in list(_FileCache.removals):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            continue
+        _FileCache.removals.discard(path)
+
+
 class _FileCache(object):
+    # Smaller files are read instead of being mapped
+    mmap_size = mmap.ALLOCATIONGRANULARITY * 16
+    removals = set()
+
     def __init__(self, path):
         self.path = path
+        self._mmap = None
+
+    @property
+    def data(self):
+        "Return the content or a read-only buffer mapped on the file"
+        if self._mmap is None:
+            with open(self.path, 'rb') as fp:
+                if os.fstat(fp.fileno()).st_size < self.mmap_size:
+                    return fp.read()
+                self._mmap = mmap.mmap(
+                    fp.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self._mmap)
 
     def __del__(self):
+        _remove_files()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Still used, the file can not be removed on Windows
+                # until the buffer is released
+                pass
         try:
             os.remove(self.path)
-        except IOError:
+        except FileNotFoundError:
             pass
+        except OSError:
+            self.removals.add(self.path)
+
+
+atexit.register(_remove_files)
 
 
 class BinaryField(Field):
@@ -1046,9 +1093,8 @@ class BinaryField(Field):
         result = record.value.get(self.name, self._default)
         if isinstance(result, _FileCache):
             try:
-                with open(result.path, 'rb') as fp:
-                    result = fp.read()
-            except IOError:
+                result = result.data
+            except (IOError, ValueError):
                 result = self.get_data(record)
         return result
 
@@ -1087,14 +1133,30 @@ class BinaryField(Field):
             except RPCException:
                 return b''
             _, filename = tempfile.mkstemp(prefix='tryton_')
-            data = values[self.name] or b''
+            data = values.pop(self.name) or b''
             if isinstance(data, str):
                 data = data.encode('utf-8')
             with open(filename, 'wb') as fp:
                 fp.write(data)
+            # Release the downloaded value as the file is used instead
+            del data
             self.set(record, _FileCache(filename))
         return self.get(record)
 
+    def save_data(self, record, filename):
+        "Write the data to filename without loading it in memory"
+        value = record.value.get(self.name)
+        if not isinstance(value, (str, bytes, _FileCache)):
+            self.get_data(record)
+            value = record.value.get(self.name)
+        if isinstance(value, _FileCache):
+            shutil.copyfile(value.path, filename)
+        else:
+            if isinstance(value, str):
+                value = value.encode('utf-8')
+            with open(filename, 'wb') as fp:
+                fp.write(value or b'')
+
 
 class DictField(Field):
 
@@ -1,17 +1,98 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import collections
+import json
+import logging
 import operator
+import weakref
 
 from tryton import rpc
 from tryton.common import MODELACCESS, RPCException, RPCExecute
-from tryton.common.domain_inversion import is_leaf
+from tryton.common.completion import CACHE as completion_cache
+from tryton.common.domain_inversion import compile_domain, is_leaf
+from tryton.common.on_change import CACHE as on_change_cache
+from tryton.jsonrpc import JSONEncoder
 from tryton.pyson import PYSONDecoder
 
-from .field import Field, M2OField, ReferenceField
-from .record import Record
+from .field import Field, M2OField, O2MField, ReferenceField
+from .record import Record, _eval_depends
+
+logger = logging.getLogger(__name__)
+
+
+class ReadAhead(object):
+    "Size and orient the records read around a fetched record"
+    # Expected duration of a read call in seconds
+    duration = 0.2
+    maximum = 500
+    # Weight of the last measure in the moving average
+    smoothing = 0.3
+
+    def __init__(self):
+        self.direction = 0
+        self.visible = None
+        self.cost = None
+        self.page = 0
+        self.pending = False
+
+    def scrolled(self, start, end):
+        "Update the visible range of positions"
+        if self.visible:
+            if start > self.visible[0]:
+                self.direction = 1
+            elif start < self.visible[0]:
+                self.direction = -1
+        self.visible = start, end
+
+    def measure(self, count, duration):
+        "Record the duration of a read of count records"
+        cost = duration / max(count, 1)
+        if self.cost is None:
+            self.cost = cost
+        else:
+            self.cost += self.smoothing * (cost - self.cost)
+
+    def size(self, minimum):
+        "Return the number of records to read"
+        if self.cost:
+            size = int(self.duration / self.cost)
+        else:
+            size = minimum
+        self.page = min(max(size, minimum), max(self.maximum, minimum))
+        return self.page
+
+    def split(self, size):
+        "Return the number of records to read before and after"
+        if self.direction:
+            behind = size // 4
+        else:
+            behind = size // 2
+        ahead = size - behind
+        if self.direction < 0:
+            behind, ahead = ahead, behind
+        return behind, ahead
+
+    def next_record(self, group, name):
+        "Return the first record of the next page not loaded"
+        if not self.direction or not self.visible or self.pending:
+            return
+        start, end = self.visible
+        page = self.page or self.size(0)
+        if self.direction > 0:
+            positions = range(end + 1, min(end + 1 + page, len(group)))
+        else:
+            positions = range(start - 1, max(start - 1 - page, -1), -1)
+        for position in positions:
+            record = group[position]
+            if (not record.destroyed
+                    and record.id >= 0
+                    and name not in record._loaded):
+                return record
 
 
 class Group(list):
+    # The groups alive by id() to reload the records changed by others
+    _instances = weakref.WeakValueDictionary()
 
     def __init__(self, model_name, fields, ids=None, parent=None,
             parent_name='', child_name='', context=None, domain=None,
@@ -21,6 +102,7 @@ class Group(list):
             domain = []
         self.__domain = domain
         self.__domain4inversion = None
+        self.__validation_graph = None
         self.lock_signal = False
         self.screens = []
         self.parent = parent
@@ -33,17 +115,21 @@ class Group(list):
         self.fields = {}
         self.load_fields(fields)
         self.current_idx = None
+        self.read_ahead = ReadAhead()
+        self.__id2record = {}
+        # Position of the records by id() rebuilt lazily when None
+        self.__positions = {}
         self.load(ids)
         self.record_deleted, self.record_removed = [], []
         self.on_write = set()
         self.__readonly = readonly
-        self.__id2record = {}
         self.__field_childs = None
         self.exclude_field = None
         self.skip_model_access = False
 
         if self.parent and self.parent.model_name == model_name:
             self.parent.group.children.append(self)
+        Group._instances[id(self)] = self
 
     @property
     def readonly(self):
@@ -103,6 +189,67 @@ class Group(list):
 
     domain4inversion = property(__get_domain4inversion)
 
+    @property
+    def validation_graph(self):
+        """Return the graph of the validation as a tuple of:
+            - the fields to validate again per changed field name
+            - the fields which must always be validated
+        The graph is rebuilt when the fields or the domain change"""
+        domain = self.domain4inversion
+        if (self.__validation_graph is None
+                or self.__validation_graph[0] is not domain):
+            self.__validation_graph = (
+                domain, self._validation_graph(domain))
+        return self.__validation_graph[1]
+
+    def _validation_graph(self, domain):
+        variables = compile_domain(domain).variables
+        domain_names = {n for n in variables if n in self.fields}
+        dependents = collections.defaultdict(set)
+        volatile = set()
+        for name, field in self.fields.items():
+            # The validity of x2many depends also on the target records
+            if isinstance(field, O2MField):
+                volatile.add(name)
+                continue
+            inputs = {name}
+            if name in variables:
+                inputs |= domain_names
+            for attr in ['domain', 'states']:
+                expr = field.attrs.get(attr)
+                if not expr or not isinstance(expr, str):
+                    continue
+                depends = _eval_depends(expr)
+                if depends is None or not all(
+                        n == 'id' or n in self.fields for n in depends):
+                    volatile.add(name)
+                    break
+                inputs |= depends
+            else:
+                for input_ in inputs:
+                    dependents[input_].add(name)
+        return dict(dependents), volatile
+
+    def __position(self, record):
+        if self.__positions is None:
+            self.__positions = {id(r): i for i, r in enumerate(self)}
+        return self.__positions.get(id(record))
+
+    def index(self, record, *args):
+        if args:
+            return super().index(record, *args)
+        idx = self.__position(record)
+        if idx is None:
+            raise ValueError('%r is not in group' % record)
+        return idx
+
+    def __contains__(self, record):
+        return self.__position(record) is not None
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self.__positions = None
+
     def insert(self, pos, record):
         assert record.group is self
         pos = min(pos, len(self))
@@ -114,6 +261,12 @@ class Group(list):
             record.next[id(self)] = None
         super(Group, self).insert(pos, record)
         self.__id2record[record.id] = record
+        self.__invalidate_parent()
+        if pos == self.__len__() - 1:
+            if self.__positions is not None:
+                self.__positions[id(record)] = pos
+        else:
+            self.__positions = None
         if not self.lock_signal:
             self._group_list_changed('record-added', record, pos)
 
@@ -124,6 +277,9 @@ class Group(list):
         record.next[id(self)] = None
         super(Group, self).append(record)
         self.__id2record[record.id] = record
+        self.__invalidate_parent()
+        if self.__positions is not None:
+            self.__positions[id(record)] = self.__len__() - 1
         if not self.lock_signal:
             self._group_list_changed(
                 'record-added', record, self.__len__() - 1)
@@ -137,8 +293,14 @@ class Group(list):
             else:
                 self.__getitem__(idx - 1).next[id(self)] = None
         self._group_list_changed('record-removed', record, idx)
-        super(Group, self).remove(record)
+        super(Group, self).__delitem__(idx)
         del self.__id2record[record.id]
+        self.__invalidate_parent()
+        if idx == self.__len__():
+            if self.__positions is not None:
+                del self.__positions[id(record)]
+        else:
+            self.__positions = None
 
     def clear(self):
         # Use reversed order to minimize the cursor reposition as the cursor
@@ -150,9 +312,17 @@ class Group(list):
             record.destroy()
             self._group_list_changed('record-removed', record, length - 1)
             self.pop()
+            self.__positions = None
             length -= 1
         self.__id2record = {}
+        self.__positions = {}
         self.record_removed, self.record_deleted = [], []
+        self.__invalidate_parent()
+
+    def __invalidate_parent(self):
+        "Invalidate the evaluation of the parent field"
+        if self.parent and self.child_name:
+            self.parent.invalidate_eval([self.child_name])
 
     def move(self, record, pos):
         if self.__len__() > pos >= 0:
@@ -169,15 +339,18 @@ class Group(list):
         return '<Group %s at %s>' % (self.model_name, id(self))
 
     def load_fields(self, fields):
+        self.__validation_graph = None
         for name, attr in fields.items():
             field = Field.get_field(attr['type'])
             attr['name'] = name
             self.fields[name] = field(attr)
 
     def save(self):
-        saved = []
-        for record in self:
-            saved.append(record.save(force_reload=False))
+        if self.parent:
+            # The parent saves all the records
+            saved = [record.save(force_reload=False) for record in self]
+        else:
+            saved = self._save_bulk()
         if self.record_deleted:
             for record in self.record_deleted:
                 self._remove(record)
@@ -186,6 +359,65 @@ class Group(list):
             del self.record_deleted[:]
         return saved
 
+    def _save_bulk(self):
+        "Save the records with one create and grouped writes"
+        to_create = [r for r in self if r.id < 0]
+        to_write = collections.OrderedDict()
+        for record in self:
+            if record.id >= 0 and record.modified:
+                value = record.get()
+                if value:
+                    key = json.dumps(value, cls=JSONEncoder, sort_keys=True)
+                    to_write.setdefault(key, (value, []))[1].append(record)
+        if len(to_create) + sum(len(r) for _, r in to_write.values()) <= 1:
+            return [record.save(force_reload=False) for record in self]
+        failed = set()
+        if to_create:
+            try:
+                # Exceptions are processed when saving one by one
+                ids = RPCExecute('model', self.model_name, 'create',
+                    [r.get() for r in to_create], context=self.context,
+                    process_exception=False)
+            except Exception:
+                logger.debug("Bulk create failed", exc_info=True)
+                failed.update(to_create)
+            else:
+                for record, id_ in zip(to_create, ids):
+                    old_id = record.id
+                    record.id = id_
+                    # The fields not loaded are no more evaluated
+                    record._eval = None
+                    self.id_changed(old_id)
+        if to_write:
+            args, timestamp = [], {}
+            for value, records in to_write.values():
+                args.extend(([r.id for r in records], value))
+                for record in records:
+                    timestamp.update(record.get_timestamp())
+            context = self.context
+            context['_timestamp'] = timestamp
+            try:
+                RPCExecute('model', self.model_name, 'write', *args,
+                    context=context, process_exception=False)
+            except Exception:
+                logger.debug("Bulk write failed", exc_info=True)
+                for _, records in to_write.values():
+                    failed.update(records)
+
+        saved, ids = [], []
+        for record in self:
+            if record in failed:
+                saved.append(record.save(force_reload=False))
+            elif record.id < 0 or record.modified:
+                record.cancel()
+                ids.append(record.id)
+                saved.append(record.id)
+            else:
+                saved.append(record.id)
+        if ids:
+            self.written(ids)
+        return saved
+
     def delete(self, records):
         if not records:
             return
@@ -206,6 +438,8 @@ class Group(list):
                 context=ctx)
         except RPCException:
             return False
+        on_change_cache.invalidate(self.model_name)
+        completion_cache.invalidate(self.model_name)
         for rec in records:
             rec.destroy()
         if reload_ids:
@@ -222,6 +456,8 @@ class Group(list):
         return root
 
     def written(self, ids):
+        on_change_cache.invalidate(self.model_name)
+        completion_cache.invalidate(self.model_name)
         if isinstance(ids, int):
             ids = [ids]
         ids = [x for x in self.on_write_ids(ids) or [] if x not in ids]
@@ -238,6 +474,32 @@ class Group(list):
             if record and not record.modified:
                 record.cancel()
 
+    @classmethod
+    def records_changed(cls, model, ids, timestamps=None):
+        """Reload the unmodified records of model changed by others and
+        display them. timestamps is an optional dictionary of the new
+        timestamp by id to skip the records already up to date."""
+        if timestamps is None:
+            timestamps = {}
+        for group in list(cls._instances.values()):
+            if group.model_name != model:
+                continue
+            changed = False
+            for id_ in ids:
+                record = group.get(id_)
+                if (not record
+                        or not record._loaded
+                        or record.modified
+                        or (record._timestamp is not None
+                            and record._timestamp == timestamps.get(
+                                str(id_)))):
+                    continue
+                record.cancel()
+                changed = True
+            if changed:
+                for screen in group.screens:
+                    screen.display()
+
     def on_write_ids(self, ids):
         if not self.on_write:
             return []
@@ -271,12 +533,12 @@ class Group(list):
             new_records.append(new_record)
 
         # Remove previously removed or deleted records
-        for record in self.record_removed[:]:
-            if record.id in ids:
-                self.record_removed.remove(record)
-        for record in self.record_deleted[:]:
-            if record.id in ids:
-                self.record_deleted.remove(record)
+        if self.record_removed or self.record_deleted:
+            ids = set(ids)
+            self.record_removed[:] = [
+                r for r in self.record_removed if r.id not in ids]
+            self.record_deleted[:] = [
+                r for r in self.record_deleted if r.id not in ids]
 
         if self.lock_signal:
             self.lock_signal = False
@@ -401,6 +663,7 @@ class Group(list):
             self.record_removed.remove(record)
         if record in self.record_deleted:
             self.record_deleted.remove(record)
+        self.__invalidate_parent()
         if modified:
             self.record_modified()
 
@@ -418,6 +681,7 @@ class Group(list):
                 if record not in self.record_deleted:
                     self.record_deleted.append(record)
         record.modified_fields.setdefault('id')
+        self.__invalidate_parent()
         if record.id < 0 or force_remove:
             self._remove(record)
 
@@ -475,6 +739,25 @@ class Group(list):
             # Trigger modified only once with the last record
             self.record_modified()
 
+    def prefetch(self, callback=None):
+        "Read in background the next page in the scroll direction"
+        for name, field in self.fields.items():
+            if field.attrs.get('loading', 'eager') == 'eager':
+                break
+        else:
+            return False
+        record = self.read_ahead.next_record(self, name)
+        if not record:
+            return False
+
+        def fetched():
+            self.read_ahead.pending = False
+            if callback:
+                callback()
+        self.read_ahead.pending = True
+        record.fetch(name, process_exception=False, callback=fetched)
+        return True
+
     def get(self, id):
         'Return record with the id'
         return self.__id2record.get(id)
@@ -484,6 +767,8 @@ class Group(list):
         record = self.__id2record[old_id]
         self.__id2record[record.id] = record
         del self.__id2record[old_id]
+        record.invalidate_eval(['id'])
+        self.__invalidate_parent()
 
     def destroy(self):
         if self.parent:
@@ -532,6 +817,7 @@ class Group(list):
                 screen.record_modified()
         else:
             self.parent.modified_fields.setdefault(self.child_name)
+            self.parent.invalidate_eval([self.child_name])
             self.parent.group.fields[self.child_name].sig_changed(self.parent)
             self.parent.validate(softvalidation=True)
             self.parent.group.record_modified()
@@ -1,17 +1,60 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import copy
 import logging
+import time
+from bisect import bisect_right
+from collections import ChainMap
+from collections.abc import Mapping
+from functools import lru_cache, partial
 
 import tryton.common as common
+import tryton.pyson as pyson
+from tryton import rpc
 from tryton.common import RPCException, RPCExecute
+from tryton.common.on_change import CACHE as on_change_cache
 from tryton.config import CONFIG
-from tryton.pyson import PYSONDecoder
 
 from . import field as fields
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=1024)
+def _eval_depends(expr):
+    """Return the field names on which the PYSON expression depends
+    or None if it depends on the parent record"""
+    depends = set()
+    for name in pyson.eval_names(expr):
+        if not isinstance(name, str) or name.startswith('_parent_'):
+            return None
+        depends.add(pyson.Eval(name).basename)
+    return frozenset(depends)
+
+
+class _EvalValues(Mapping):
+    "Read-only view on the cached evaluation values of a record"
+    __slots__ = ('_values',)
+
+    def __init__(self, values):
+        self._values = values
+
+    def __getitem__(self, key):
+        value = self._values[key]
+        if isinstance(value, (list, dict)):
+            value = copy.deepcopy(value)
+        return value
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+
 class Record:
 
     id = -100000000
@@ -30,6 +73,17 @@ class Record:
         if group is not None:
             assert model_name == group.model_name
         self.state_attrs = {}
+        # Evaluated states and their dependencies per field name
+        self._states = {}
+        # Evaluation values of the fields updated when they are invalidated
+        self._eval = None
+        self._eval_fields = 0
+        self._eval_stale = set()
+        # Validation results per field name for the validation graph
+        self._validated = {}
+        self._validated_graph = None
+        # The changed fields coalesced while running their on_change
+        self._changing = None
         self.modified_fields = {}
         self._timestamp = None
         self._write = True
@@ -46,7 +100,9 @@ class Record:
     def __getitem__(self, name):
         return self.fetch(name)
 
-    def fetch(self, name, process_exception=True):
+    def fetch(self, name, process_exception=True, callback=None):
+        """Read the field name and the neighbouring records
+        asynchronously if callback is set"""
         if not self.destroyed and self.id >= 0 and name not in self._loaded:
             id2record = {
                 self.id: self,
@@ -89,6 +145,7 @@ class Record:
             fnames.extend(['_timestamp', '_write', '_delete'])
 
             record_context = self.get_context()
+            read_ahead = self.group.root_group.read_ahead
             if loading == 'eager':
                 # JCA: This controls how many lines will be fetched at once
                 # (typically when opening a list view).
@@ -96,7 +153,8 @@ class Record:
                 # for models with a lot of fields, reading "one by one" is
                 # probably not the solution anyway. A minimum of 20 makes it 2
                 # calls to fill a list view, and seems good enough
-                limit = max(int(CONFIG['client.limit'] / len(fnames)), 20)
+                limit = read_ahead.size(
+                    max(int(CONFIG['client.limit'] / len(fnames)), 20))
 
                 def filter_group(record):
                     return (not record.destroyed
@@ -106,36 +164,70 @@ class Record:
                 def filter_parent_group(record):
                     return (filter_group(record)
                         and record.id not in id2record
-                        and ((record.group == self.group)
+                        and ((record.group is self.group)
                             # Don't compute context for same group
                             or (record.get_context() == record_context)))
 
                 if self.parent and self.parent.model_name == self.model_name:
-                    group = sum(self.parent.group.children, [])
+                    groups = self.parent.group.children
                     filter_ = filter_parent_group
                 else:
-                    group = self.group
+                    groups = [self.group]
                     filter_ = filter_group
-                if self in group:
-                    idx = group.index(self)
-                    length = len(group)
+                # Address the records of the groups as if they were
+                # concatenated without building the list
+                offsets, length, idx = [], 0, None
+                for group in groups:
+                    if group is self.group and self in group:
+                        idx = length + group.index(self)
+                    offsets.append(length)
+                    length += len(group)
+
+                def get(i):
+                    n = bisect_right(offsets, i) - 1
+                    return groups[n][i - offsets[n]]
+
+                if idx is not None:
+                    # Read more records in the scroll direction and give the
+                    # remaining to the other side when one reaches the end
+                    behind, ahead = read_ahead.split(limit - 1)
                     n = 1
                     while len(id2record) < limit and (idx - n >= 0
                             or idx + n < length) and n < 2 * limit:
-                        if idx - n >= 0:
-                            record = group[idx - n]
+                        if idx - n >= 0 and (behind > 0 or idx + n >= length):
+                            record = get(idx - n)
                             if filter_(record):
                                 id2record[record.id] = record
-                        if idx + n < length:
-                            record = group[idx + n]
+                                behind -= 1
+                        if idx + n < length and (ahead > 0 or idx - n < 0):
+                            record = get(idx + n)
                             if filter_(record):
                                 id2record[record.id] = record
+                                ahead -= 1
                         n += 1
 
             ctx = record_context.copy()
             ctx.update(dict(('%s.%s' % (self.model_name, fname), 'size')
                     for fname, field in self.group.fields.items()
                     if field.attrs['type'] == 'binary' and fname in fnames))
+            start = time.monotonic()
+            if callback:
+                def fetched(result):
+                    try:
+                        values = result()
+                    except Exception:
+                        # Let the next synchronous fetch read them again
+                        logger.debug(
+                            "Background read failed", exc_info=True)
+                    else:
+                        read_ahead.measure(
+                            len(id2record), time.monotonic() - start)
+                        self._set_fetched(id2record, values)
+                    callback()
+                RPCExecute('model', self.model_name, 'read',
+                    list(id2record.keys()), fnames, context=ctx,
+                    process_exception=False, callback=fetched)
+                return
             exception = False
             try:
                 values = RPCExecute('model', self.model_name, 'read',
@@ -147,18 +239,27 @@ class Record:
                 for value in values:
                     value.update(default_values)
                 self.exception = exception = True
-            id2value = dict((value['id'], value) for value in values)
-            for id, record in id2record.items():
-                if not record.exception:
-                    record.exception = exception
-                value = id2value.get(id)
-                if record and not record.destroyed and value:
-                    for key in record.modified_fields:
-                        value.pop(key, None)
-                    record.set(value, modified=False)
+            else:
+                read_ahead.measure(len(id2record), time.monotonic() - start)
+            self._set_fetched(id2record, values, exception=exception)
+        elif callback:
+            callback()
+            return
         if name != '*':
             return self.group.fields[name]
 
+    @staticmethod
+    def _set_fetched(id2record, values, exception=False):
+        id2value = dict((value['id'], value) for value in values)
+        for id, record in id2record.items():
+            if not record.exception:
+                record.exception = exception
+            value = id2value.get(id)
+            if record and not record.destroyed and value:
+                for key in record.modified_fields:
+                    value.pop(key, None)
+                record.set(value, modified=False)
+
     def __repr__(self):
         return '<Record %s@%s at %s>' % (self.id, self.model_name, id(self))
 
@@ -319,13 +420,30 @@ class Record:
         return value
 
     def get_eval(self):
-        value = {}
-        for name, field in self.group.fields.items():
-            if name not in self._loaded and self.id >= 0:
-                continue
-            value[name] = field.get_eval(self)
-        value['id'] = self.id
-        return value
+        return dict(self.eval_snapshot())
+
+    def eval_snapshot(self):
+        """Return a read-only mapping of the evaluation values of the record
+        The values are cached so the mutable ones are copied when accessed"""
+        snapshot = self._eval
+        fields = self.group.fields
+        if snapshot is None or self._eval_fields != len(fields):
+            snapshot = self._eval = {}
+            self._eval_stale.clear()
+            self._eval_fields = len(fields)
+            names = fields.keys()
+        else:
+            names = self._eval_stale
+        if names:
+            for name in names:
+                field = fields.get(name)
+                if field and (name in self._loaded or self.id < 0):
+                    snapshot[name] = field.get_eval(self)
+                else:
+                    snapshot.pop(name, None)
+            self._eval_stale.clear()
+        snapshot['id'] = self.id
+        return _EvalValues(snapshot)
 
     def get_on_change_value(self, skip=None):
         value = {}
@@ -341,6 +459,9 @@ class Record:
         return value
 
     def cancel(self):
+        self._states.clear()
+        self._validated.clear()
+        self._eval = None
         self._loaded.clear()
         self.modified_fields.clear()
         self._timestamp = None
@@ -376,6 +497,8 @@ class Record:
                     return False
                 old_id = self.id
                 self.id = res
+                # The fields not loaded are no more evaluated
+                self._eval = None
                 self.group.id_changed(old_id)
             elif self.modified:
                 if value:
@@ -432,6 +555,12 @@ class Record:
         elif fields is None:
             self._check_load()
         res = True
+        graph = self.group.validation_graph
+        if self._validated_graph is not graph:
+            self._validated.clear()
+            self._validated_graph = graph
+        _, volatile = graph
+        key = softvalidation, self.readonly or self.group.readonly
         for field_name, field in self.group.fields.items():
             if fields is not None and field_name not in fields:
                 continue
@@ -439,7 +568,24 @@ class Record:
                 continue
             if field_name == self.group.exclude_field:
                 continue
-            if not field.validate(self, softvalidation, pre_validate):
+            cache = not pre_validate and field_name not in volatile
+            if cache and field_name in self._validated:
+                cached_key, valid, invalid, domain_readonly = (
+                    self._validated[field_name])
+                if cached_key == key:
+                    state_attrs = field.get_state_attrs(self)
+                    state_attrs['invalid'] = invalid
+                    state_attrs['domain_readonly'] = domain_readonly
+                    if not valid:
+                        res = False
+                    continue
+            valid = field.validate(self, softvalidation, pre_validate)
+            if cache:
+                state_attrs = field.get_state_attrs(self)
+                self._validated[field_name] = (key, valid,
+                    state_attrs.get('invalid'),
+                    state_attrs.get('domain_readonly'))
+            if not valid:
                 res = False
         return res
 
@@ -476,8 +622,8 @@ class Record:
             self.group.fields[fieldname].set_default(self, value)
             self._loaded.add(fieldname)
             fieldnames.append(fieldname)
-        self.on_change(fieldnames)
-        self.on_change_with(fieldnames)
+        self.invalidate_eval(fieldnames)
+        self.on_changes(fieldnames)
         if validate:
             self.validate(softvalidation=True)
         if modified:
@@ -515,6 +661,7 @@ class Record:
         for fieldname, value in later.items():
             self.group.fields[fieldname].set(self, value)
             self._loaded.add(fieldname)
+        self.invalidate_eval(fieldnames + list(later))
         if validate:
             self.validate(fieldnames, softvalidation=True)
         if modified:
@@ -530,6 +677,7 @@ class Record:
                 self.value[related] = values.get(related) or {}
             # Load fieldname before setting value
             self[fieldname].set_on_change(self, value)
+        self.invalidate_eval(values)
 
     def reload(self, fields=None):
         if self.id < 0:
@@ -546,11 +694,42 @@ class Record:
         self.set(value, modified=False)
 
         if self.parent:
-            self.parent.on_change([self.group.child_name])
-            self.parent.on_change_with([self.group.child_name])
+            self.parent.on_changes([self.group.child_name])
 
         self.set_modified()
 
+    def get_states(self, field):
+        "Return the evaluated states of the field"
+        expr = field.attrs.get('states', {})
+        if field.name in self._states:
+            cached_expr, states, _ = self._states[field.name]
+            if cached_expr == expr:
+                return states
+        states = self.expr_eval(expr)
+        if isinstance(expr, str) and expr:
+            depends = _eval_depends(expr)
+            if depends is not None and all(
+                    n == 'id' or n in self.group.fields for n in depends):
+                self._states[field.name] = (expr, states, depends)
+        return states
+
+    def invalidate_eval(self, names):
+        """Invalidate the evaluation of the fields and the states and the
+        validations depending on"""
+        names = set(names)
+        if self._eval is not None:
+            self._eval_stale.update(names)
+        if self._validated:
+            dependents, _ = self.group.validation_graph
+            for name in names:
+                for dependent in dependents.get(name, ()):
+                    self._validated.pop(dependent, None)
+        if not self._states:
+            return
+        for name, (_, _, depends) in list(self._states.items()):
+            if depends & names:
+                del self._states[name]
+
     def expr_eval(self, expr):
         if not isinstance(expr, str):
             return expr
@@ -560,15 +739,15 @@ class Record:
             return []
         elif expr == '{}':
             return {}
-        ctx = self.get_eval()
-        ctx['context'] = self.get_context()
-        ctx['active_model'] = self.model_name
-        ctx['active_id'] = self.id
+        ctx = {
+            'context': self.get_context(),
+            'active_model': self.model_name,
+            'active_id': self.id,
+            }
         if self.parent and self.parent_name:
             ctx['_parent_' + self.parent_name] = \
                 common.EvalEnvironment(self.parent)
-        val = PYSONDecoder(ctx).decode(expr)
-        return val
+        return pyson.compile(expr)(ChainMap(ctx, self.eval_snapshot()))
 
     def _get_on_change_args(self, args):
         res = {}
@@ -583,49 +762,147 @@ class Record:
                 res[arg] = scope
         return res
 
-    def on_change(self, fieldnames):
-        values = {}
+    def changed(self, fieldnames):
+        """Call the on_change, on_change_with and autocomplete of the changed
+        fields in one round-trip
+        The changes triggered while running are coalesced in a next pass."""
+        if self._changing is not None:
+            self._changing.update(dict.fromkeys(fieldnames))
+            return
+        self._changing = dict.fromkeys(fieldnames)
+        try:
+            while self._changing:
+                fieldnames = list(self._changing)
+                self._changing.clear()
+                calls = (self._on_change_calls(fieldnames)
+                    + self._on_change_with_calls(fieldnames))
+                for fieldname in fieldnames:
+                    calls += self._autocomplete_calls(fieldname)
+                self._execute_calls(calls)
+        finally:
+            self._changing = None
+        self.set_field_context()
+
+    def _execute_calls(self, calls):
+        """Execute the calls in one round-trip and apply their results in
+        order
+        A call is executed again if its arguments are changed by the results
+        of the previous calls or of the calls executed again."""
+        order = {id(c): i for i, c in enumerate(calls)}
+        applied, retried = {}, set()
+        while calls:
+            # The applied calls following a call executed again may depend on
+            # its result
+            first = order[id(calls[0])]
+            watched = [(c, self._get_on_change_args(c[1]))
+                for k, c in applied.items()
+                if order[k] > first and k not in retried]
+            sent = [self._get_on_change_args(c[1]) for c in calls]
+            context = rpc.CONTEXT.copy()
+            context.update(self.get_context())
+            results, keys = [None] * len(calls), [None] * len(calls)
+            for i, ((method, _, params, _), values) in enumerate(
+                    zip(calls, sent)):
+                if not on_change_cache.enabled(self.model_name, method):
+                    continue
+                key = on_change_cache.key(
+                    self.model_name, method, values, params, context)
+                try:
+                    result = on_change_cache.get(key)
+                except KeyError:
+                    keys[i] = key
+                else:
+                    results[i] = rpc.BatchCall(None)
+                    results[i].set(result)
+            missing = [i for i, r in enumerate(results) if r is None]
+            if len(missing) > 1:
+                with rpc.batch() as batch:
+                    for i in missing:
+                        method, _, params, _ = calls[i]
+                        results[i] = batch.execute(
+                            'model', self.model_name, method, sent[i],
+                            *params, context)
+            stale = []
+            for i, (call, values, result, key) in enumerate(
+                    zip(calls, sent, results, keys)):
+                method, args, params, apply = call
+                # The first call can not be changed by a previous one
+                if i and self._get_on_change_args(args) != values:
+                    stale.append(call)
+                    continue
+                apply(partial(
+                        self._on_change_result, method, values, params,
+                        result, key))
+                applied[id(call)] = call
+            for call, values in watched:
+                if self._get_on_change_args(call[1]) != values:
+                    retried.add(id(call))
+                    stale.append(call)
+            calls = sorted(stale, key=lambda c: order[id(c)])
+
+    def _on_change_result(
+            self, method, values, params, call=None, key=None):
+        result = None
+        if call is not None:
+            try:
+                result = call.result()
+            except Exception:
+                # The exception is processed by executing the call alone
+                logger.debug("Batched %s failed", method, exc_info=True)
+                call = None
+        if call is None:
+            result = RPCExecute('model', self.model_name, method, values,
+                *params, context=self.get_context())
+        if key is not None:
+            on_change_cache.set(key, result)
+        return result
+
+    def _on_change_calls(self, fieldnames):
+        "Return the calls of on_change and on_change_notify"
+        calls = []
+        args = []
         for fieldname in fieldnames:
             on_change = self.group.fields[fieldname].attrs.get('on_change')
-            if not on_change:
-                continue
-            values.update(self._get_on_change_args(on_change))
+            if on_change:
+                args.extend(on_change)
 
-        if values:
-            try:
+        if args:
+            def apply(result):
+                try:
+                    changes = result()
+                except RPCException:
+                    return
                 if len(fieldnames) == 1:
-                    fieldname, = fieldnames
-                    changes = []
-                    changes.append(RPCExecute(
-                            'model', self.model_name, 'on_change_' + fieldname,
-                            values, context=self.get_context()))
-                else:
-                    changes = RPCExecute(
-                        'model', self.model_name, 'on_change',
-                        values, fieldnames, context=self.get_context())
-            except RPCException:
-                pass
-            else:
+                    changes = [changes]
                 for change in changes:
                     self.set_on_change(change)
+            if len(fieldnames) == 1:
+                fieldname, = fieldnames
+                calls.append(('on_change_' + fieldname, args, (), apply))
+            else:
+                calls.append(('on_change', args, (list(fieldnames),), apply))
 
         notification_fields = common.MODELNOTIFICATION.get(self.model_name)
         if set(fieldnames) & set(notification_fields):
-            values = self._get_on_change_args(notification_fields)
-            try:
-                notifications = RPCExecute(
-                    'model', self.model_name, 'on_change_notify', values,
-                    context=self.get_context())
-            except RPCException:
-                pass
-            else:
+            def notify(result):
+                try:
+                    notifications = result()
+                except RPCException:
+                    return
                 self.group.record_notify(notifications)
+            calls.append(
+                ('on_change_notify', list(notification_fields), (), notify))
+        return calls
 
-    def on_change_with(self, field_names):
+    def on_change(self, fieldnames):
+        self._execute_calls(self._on_change_calls(fieldnames))
+
+    def _on_change_with_calls(self, field_names):
+        "Return the calls of on_change_with"
         field_names = set(field_names)
-        fieldnames = set()
-        values = {}
-        later = set()
+        fieldnames = []
+        args = []
+        later = []
         for fieldname in self.group.fields:
             on_change_with = self.group.fields[fieldname].attrs.get(
                     'on_change_with')
@@ -633,49 +910,78 @@ class Record:
                 continue
             if not field_names & set(on_change_with):
                 continue
-            if fieldnames & set(on_change_with):
-                later.add(fieldname)
+            if set(fieldnames) & set(on_change_with):
+                later.append(fieldname)
                 continue
-            fieldnames.add(fieldname)
-            values.update(self._get_on_change_args(on_change_with))
+            fieldnames.append(fieldname)
+            args.extend(on_change_with)
             if isinstance(self.group.fields[fieldname], (fields.M2OField,
                         fields.ReferenceField)):
                 self.value.pop(fieldname + '.', None)
-        if fieldnames:
-            try:
-                if len(fieldnames) == 1:
-                    fieldname, = fieldnames
-                    result = {}
-                    result[fieldname] = RPCExecute(
-                        'model', self.model_name,
-                        'on_change_with_' + fieldname,
-                        values, context=self.get_context())
-                else:
-                    result = RPCExecute(
-                        'model', self.model_name, 'on_change_with',
-                        values, list(fieldnames), context=self.get_context())
-            except RPCException:
-                return
-            self.set_on_change(result)
+        calls = []
+        # The next calls are skipped once one fails
+        failed = []
+
+        def call(method, args, params, apply):
+            def apply_(result):
+                if failed:
+                    return
+                try:
+                    value = result()
+                except RPCException:
+                    failed.append(method)
+                    return
+                apply(value)
+            calls.append((method, args, params, apply_))
+
+        if len(fieldnames) == 1:
+            fieldname, = fieldnames
+            call('on_change_with_' + fieldname, args, (),
+                lambda value, fieldname=fieldname: self.set_on_change(
+                    {fieldname: value}))
+        elif fieldnames:
+            call('on_change_with', args, (fieldnames,), self.set_on_change)
         for fieldname in later:
             on_change_with = self.group.fields[fieldname].attrs.get(
                     'on_change_with')
-            values = self._get_on_change_args(on_change_with)
-            try:
-                result = RPCExecute('model', self.model_name,
-                    'on_change_with_' + fieldname, values,
-                    context=self.get_context())
-            except RPCException:
-                return
             # Load fieldname before setting value
-            self[fieldname].set_on_change(self, result)
+            call('on_change_with_' + fieldname, on_change_with, (),
+                partial(self._set_on_change_with, fieldname))
+        return calls
 
-    def autocomplete_with(self, field_name):
+    def _set_on_change_with(self, fieldname, value):
+        self[fieldname].set_on_change(self, value)
+
+    def on_change_with(self, field_names):
+        self._execute_calls(self._on_change_with_calls(field_names))
+
+    def on_changes(self, fieldnames):
+        "Call on_change and on_change_with of the fields in one round-trip"
+        self._execute_calls(self._on_change_calls(fieldnames)
+            + self._on_change_with_calls(fieldnames))
+
+    def _autocomplete_calls(self, field_name):
+        "Return the calls of the autocomplete depending on the field"
+        calls = []
         for fieldname, fieldinfo in self.group.fields.items():
             autocomplete = fieldinfo.attrs.get('autocomplete', [])
             if field_name not in autocomplete:
                 continue
-            self.do_autocomplete(fieldname)
+            self.autocompletion[fieldname] = []
+
+            def apply(result, fieldname=fieldname):
+                try:
+                    res = result()
+                except RPCException:
+                    # ensure res is a list
+                    res = []
+                self.autocompletion[fieldname] = res
+            calls.append(
+                ('autocomplete_' + fieldname, autocomplete, (), apply))
+        return calls
+
+    def autocomplete_with(self, field_name):
+        self._execute_calls(self._autocomplete_calls(field_name))
 
     def do_autocomplete(self, fieldname):
         self.autocompletion[fieldname] = []
@@ -9,7 +9,6 @@ import gettext
 import json
 import logging
 import urllib.parse
-import xml.dom.minidom
 from operator import itemgetter
 
 from gi.repository import GLib, Gtk
@@ -17,7 +16,7 @@ from gi.repository import GLib, Gtk
 from tryton.action import Action
 from tryton.common import (
     MODELACCESS, RPCContextReload, RPCException, RPCExecute, node_attributes,
-    sur, warning)
+    parse_arch, sur, warning)
 from tryton.common.domain_parser import DomainParser
 from tryton.config import CONFIG
 from tryton.gui.window.infobar import InfoBar
@@ -52,6 +51,10 @@ class Screen:
                 or MODELACCESS[model_name]['create']):
             self.readonly = True
         self.search_count = 0
+        # True while the search count is computed in background
+        self.search_counting = False
+        self.__search_id = None
+        self.__tab_count_ids = {}
         if not attributes.get('row_activate'):
             self.row_activate = self.default_row_activate
         else:
@@ -71,6 +74,7 @@ class Screen:
             lambda: collections.defaultdict(lambda: None))
         self.tree_states_done = set()
         self.__current_record = None
+        self.__prefetch_id = None
         self.__group = None
         self.new_group(context or {})
         self.current_record = None
@@ -202,7 +206,7 @@ class Screen:
 
         if 'arch' in view_tree:
             # Filter only fields in XML view
-            xml_dom = xml.dom.minidom.parseString(view_tree['arch'])
+            xml_dom = parse_arch(view_tree['arch'])
             root_node, = xml_dom.childNodes
             ofields = collections.OrderedDict()
             for node in root_node.childNodes:
@@ -294,6 +298,19 @@ class Screen:
         context = self.context
         if self.screen_container.but_active.get_active():
             context['active_test'] = False
+        if not only_ids:
+            # The tab counters are computed in background during the search
+            self.count_tab_domain()
+            # A new search cancels the pending count
+            self.__search_id = search_id = object()
+            if self.limit is not None:
+                # The count is sent before waiting for the search
+                RPCExecute(
+                    'model', self.model_name, 'search_count',
+                    domain, 0, self.count_limit, context=context,
+                    callback=functools.partial(
+                        self._set_search_count, search_id=search_id,
+                        size=self.limit))
         try:
             ids = RPCExecute('model', self.model_name, 'search', domain,
                 self.offset, self.limit, self.order, context=context)
@@ -301,28 +318,43 @@ class Screen:
             ids = []
         if not only_ids:
             if self.limit is not None and len(ids) == self.limit:
-                try:
-                    self.search_count = RPCExecute(
-                        'model', self.model_name, 'search_count',
-                        domain, 0, self.count_limit, context=context)
-                except RPCException:
-                    self.search_count = 0
+                self.search_count = self.offset + len(ids)
+                self.search_counting = True
             else:
+                # The count is known without waiting for it
+                self.__search_id = None
                 self.search_count = len(ids)
+                self.search_counting = False
         self.screen_container.but_prev.set_sensitive(bool(self.offset))
-        if (self.limit is not None
-                and len(ids) == self.limit
-                and self.search_count > self.limit + self.offset):
-            self.screen_container.but_next.set_sensitive(True)
-        else:
-            self.screen_container.but_next.set_sensitive(False)
+        self._set_but_next(len(ids))
         if only_ids:
             return ids
         self.clear()
         self.load(ids)
-        self.count_tab_domain()
         return bool(ids)
 
+    def _set_but_next(self, size):
+        if (self.limit is not None
+                and size == self.limit
+                and (self.search_counting
+                    or self.search_count > self.limit + self.offset)):
+            self.screen_container.but_next.set_sensitive(True)
+        else:
+            self.screen_container.but_next.set_sensitive(False)
+
+    def _set_search_count(self, count, search_id, size):
+        if search_id is not self.__search_id:
+            return
+        self.search_counting = False
+        try:
+            self.search_count = count()
+        except RPCException:
+            self.search_count = 0
+        self._set_but_next(size)
+        self.record_message(
+            self.position, len(self.group) + self.offset,
+            self.search_count, self.current_record and self.current_record.id)
+
     def search_domain(self, search_string=None, set_text=False, with_tab=True):
         domain = []
         # Test first parent to avoid calling unnecessary domain_parser
@@ -365,7 +397,10 @@ class Screen:
         return domain
 
     def count_tab_domain(self, current=False):
-        def set_tab_counter(count, idx):
+        def set_tab_counter(count, idx, count_id=None):
+            # Skip the result of a count replaced by a new one
+            if count_id is not self.__tab_count_ids.get(idx):
+                return
             try:
                 count = count()
             except RPCException:
@@ -380,10 +415,12 @@ class Screen:
                 continue
             domain = ['AND', self.screen_container.get_tab_domain_for_idx(idx),
                 screen_domain]
-            set_tab_counter(lambda: None, idx)
+            self.__tab_count_ids[idx] = count_id = object()
+            set_tab_counter(lambda: None, idx, count_id)
             RPCExecute('model', self.model_name,
                 'search_count', domain, 0, 1000, context=self.context,
-                callback=functools.partial(set_tab_counter, idx=idx))
+                callback=functools.partial(
+                    set_tab_counter, idx=idx, count_id=count_id))
 
     def get_domain(self):
         if not self.domain or not isinstance(self.domain, str):
@@ -509,6 +546,13 @@ class Screen:
             # Somehow _validate_synced_group should be called, but it does not
             # work as intended yet.
             self._sync_group()
+            if (record and CONFIG['client.prefetch_lazy']
+                    and self.current_view
+                    and self.current_view.view_type == 'tree'):
+                if self.__prefetch_id is not None:
+                    GLib.source_remove(self.__prefetch_id)
+                self.__prefetch_id = GLib.idle_add(
+                    self._prefetch_lazy, record)
         self.update_resources(record.resources if record else None)
         # update resources after 1 second
         GLib.timeout_add(1000, self._update_resources, record)
@@ -516,6 +560,30 @@ class Screen:
 
     current_record = property(__get_current_record, __set_current_record)
 
+    def _prefetch_lazy(self, record):
+        "Read in background the lazy fields of the record and its neighbours"
+        self.__prefetch_id = None
+        group = record.group
+        if group is None or record not in group:
+            return False
+        idx = group.index(record)
+        records = [group[i] for i in [idx, idx + 1, idx - 1]
+            if 0 <= i < len(group)]
+
+        def fetch():
+            while records:
+                record = records.pop(0)
+                if record.destroyed or record.id < 0:
+                    continue
+                for name, field in group.fields.items():
+                    if (field.attrs.get('loading') == 'lazy'
+                            and name not in record._loaded):
+                        record.fetch(
+                            name, process_exception=False, callback=fetch)
+                        return
+        fetch()
+        return False
+
     def _validate_synced_group(self):
         if not self._multiview_form or self.current_view.view_type != 'tree':
             return True
@@ -566,6 +634,9 @@ class Screen:
 
     def destroy(self):
         self.windows.clear()
+        if self.__prefetch_id is not None:
+            GLib.source_remove(self.__prefetch_id)
+            self.__prefetch_id = None
         for view in self.views:
             view.destroy()
         del self.views[:]
@@ -666,7 +737,7 @@ class Screen:
         fields = view['fields']
         view_id = view['view_id']
 
-        xml_dom = xml.dom.minidom.parseString(arch)
+        xml_dom = parse_arch(arch)
         root, = xml_dom.childNodes
         if root.tagName == 'tree':
             self.fields_view_tree[view_id] = view
@@ -1458,6 +1529,8 @@ class Screen:
             context['active_test'] = False
         self.search_count = RPCExecute(
             'model', self.model_name, 'search_count', domain, context=context)
+        self.__search_id = None
+        self.search_counting = False
         self.record_message(
             self.position, len(self.group) + self.offset,
             self.search_count, self.current_record and self.current_record.id)
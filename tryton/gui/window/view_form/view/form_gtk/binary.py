@@ -135,8 +135,11 @@ class BinaryMixin(Widget):
         filename = file_selection(_('Save As...'), filename=filename,
             action=Gtk.FileChooserAction.SAVE)
         if filename:
-            with open(filename, 'wb') as fp:
-                fp.write(self.get_data())
+            if hasattr(self.field, 'save_data'):
+                self.field.save_data(self.record, filename)
+            else:
+                with open(filename, 'wb') as fp:
+                    fp.write(self.get_data())
 
     def clear(self, widget=None):
         if self.filename_field:
@@ -122,12 +122,22 @@ class Image(StateMixin, Gtk.Image):
             name = field.get(record)
         size = int(self.attrs.get('size', 48))
         if self.attrs.get('type') == 'url':
+            self._url = (name, size)
             pixbuf = common.IconFactory.get_pixbuf_url(
-                name, size=size, size_param=self.attrs.get('url_size'))
+                name, size=size, size_param=self.attrs.get('url_size'),
+                callback=self._url_loaded)
         else:
+            self._url = None
             pixbuf = common.IconFactory.get_pixbuf(name, size)
         self.set_from_pixbuf(pixbuf)
 
+    def _url_loaded(self):
+        if not getattr(self, '_url', None):
+            return
+        name, size = self._url
+        self.set_from_pixbuf(common.IconFactory.get_pixbuf_url(
+                name, size=size, size_param=self.attrs.get('url_size')))
+
 
 class Frame(StateMixin, Gtk.Frame):
 
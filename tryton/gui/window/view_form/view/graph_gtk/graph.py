@@ -11,12 +11,12 @@ import cairo
 from dateutil.relativedelta import relativedelta
 from gi.repository import Gdk, Gtk
 
+import tryton.pyson as pyson
 import tryton.rpc as rpc
 from tryton.action import Action
 from tryton.common import COLOR_SCHEMES, generateColorscheme, hex2rgb
 from tryton.config import CONFIG
 from tryton.gui.window import Window
-from tryton.pyson import PYSONDecoder
 
 
 class Popup(object):
@@ -376,7 +376,7 @@ class Graph(Gtk.DrawingArea):
                     context['_user'] = rpc._USER
                     for field in model.group.fields:
                         context[field] = model[field].get(model)
-                    if not PYSONDecoder(context).decode(yfield['domain']):
+                    if not pyson.compile(yfield['domain'])(context):
                         continue
                 self.datas[x].setdefault(key, 0.0)
                 if yfield['name'] == '#':
@@ -6,6 +6,7 @@ import json
 import locale
 import logging
 import sys
+import weakref
 from functools import wraps
 
 from gi.repository import Gdk, GLib, GObject, Gtk, Pango
@@ -64,38 +65,26 @@ def path_convert_id2pos(model, id_path):
     return tuple(indexes)
 
 
-class AdaptModelGroup(GenericTreeModel):
+def _sort_group(group, ids):
+    "Sort the records of group in the order of ids and return the new order"
+    old_idx = {record.id: i for i, record in enumerate(group)}
+    new_idx = {id_: i for i, id_ in enumerate(ids)}
+    size = len(group)
+    group.sort(key=lambda r: new_idx.get(r.id, size))
+    new_order = []
+    prev = None
+    for record in group:
+        new_order.append(old_idx.get(record.id))
+        if prev:
+            prev.next[id(group)] = record
+        prev = record
+    if prev:
+        prev.next[id(group)] = None
+    return new_order
 
-    def __init__(self, group, children_field=None, children_definitions=None):
-        super(AdaptModelGroup, self).__init__()
-        self.group = group
-        self.set_property('leak_references', False)
-        self.children_field = children_field
-        self.children_definitions = children_definitions or []
-        self.__removed = None  # XXX dirty hack to allow update of has_child
 
-    def added(self, group, record):
-        if (group is self.group
-                and (record.group is self.group
-                    or record.group.child_name == self.children_field)):
-            path = record.get_index_path(self.group)
-            iter_ = self.get_iter(path)
-            self.row_inserted(path, iter_)
-            if record.children_group(self.children_field,
-                    self.children_definitions):
-                self.row_has_child_toggled(path, iter_)
-            if (record.parent
-                    and record.group is not self.group):
-                path = record.parent.get_index_path(self.group)
-                iter_ = self.get_iter(path)
-                self.row_has_child_toggled(path, iter_)
-
-    def removed(self, group, record):
-        if (group is self.group
-                and (record.group is self.group
-                    or record.group.child_name == self.children_field)):
-            path = record.get_index_path(self.group)
-            self.row_deleted(path)
+class ModelGroupMixin(object):
+    "Edition of the group shared by the tree models"
 
     def append(self, model):
         self.group.add(model)
@@ -103,11 +92,6 @@ class AdaptModelGroup(GenericTreeModel):
     def prepend(self, model):
         self.group.add(model, 0)
 
-    def remove(self, iter_):
-        record = self.get_value(iter_, 0)
-        record.group.remove(record)
-        self.invalidate_iters()
-
     def __move(self, record, path, offset=0):
         iter_ = self.get_iter(path)
         record_pos = self.get_value(iter_, 0)
@@ -124,6 +108,7 @@ class AdaptModelGroup(GenericTreeModel):
             if not record.parent_name:
                 record.modified_fields.setdefault(prev_group.parent_name)
                 record.value[prev_group.parent_name] = None
+                record.invalidate_eval([prev_group.parent_name])
             else:
                 record.modified_fields.setdefault(record.parent_name)
         group.move(record, pos)
@@ -150,20 +135,50 @@ class AdaptModelGroup(GenericTreeModel):
             record.modified_fields.setdefault(record.parent_name or 'id')
         group.move(record, 0)
 
+    def __len__(self):
+        return len(self.group)
+
+
+class AdaptModelGroup(ModelGroupMixin, GenericTreeModel):
+
+    def __init__(self, group, children_field=None, children_definitions=None):
+        super(AdaptModelGroup, self).__init__()
+        self.group = group
+        self.set_property('leak_references', False)
+        self.children_field = children_field
+        self.children_definitions = children_definitions or []
+        self.__removed = None  # XXX dirty hack to allow update of has_child
+
+    def added(self, group, record):
+        if (group is self.group
+                and (record.group is self.group
+                    or record.group.child_name == self.children_field)):
+            path = record.get_index_path(self.group)
+            iter_ = self.get_iter(path)
+            self.row_inserted(path, iter_)
+            if record.children_group(self.children_field,
+                    self.children_definitions):
+                self.row_has_child_toggled(path, iter_)
+            if (record.parent
+                    and record.group is not self.group):
+                path = record.parent.get_index_path(self.group)
+                iter_ = self.get_iter(path)
+                self.row_has_child_toggled(path, iter_)
+
+    def removed(self, group, record):
+        if (group is self.group
+                and (record.group is self.group
+                    or record.group.child_name == self.children_field)):
+            path = record.get_index_path(self.group)
+            self.row_deleted(path)
+
+    def remove(self, iter_):
+        record = self.get_value(iter_, 0)
+        record.group.remove(record)
+        self.invalidate_iters()
+
     def sort(self, ids):
-        old_idx = {record.id: i for i, record in enumerate(self.group)}
-        new_idx = {id_: i for i, id_ in enumerate(ids)}
-        size = len(self.group)
-        self.group.sort(key=lambda r: new_idx.get(r.id, size))
-        new_order = []
-        prev = None
-        for record in self.group:
-            new_order.append(old_idx.get(record.id))
-            if prev:
-                prev.next[id(self.group)] = record
-            prev = record
-        if prev:
-            prev.next[id(self.group)] = None
+        new_order = _sort_group(self.group, ids)
         path = Gtk.TreePath()
         # XXX pygobject does not allow to create empty TreePath,
         # it is always a path of 0
@@ -173,9 +188,6 @@ class AdaptModelGroup(GenericTreeModel):
                 path.up()
         self.rows_reordered(path, None, new_order)
 
-    def __len__(self):
-        return len(self.group)
-
     def on_get_flags(self):
         if not self.children_field:
             return Gtk.TreeModelFlags.LIST_ONLY
@@ -271,6 +283,121 @@ class AdaptModelGroup(GenericTreeModel):
         return record.parent
 
 
+class StoreModelGroup(ModelGroupMixin, Gtk.TreeStore):
+    """Tree model storing the records in a native store kept in sync with
+    the signals of the group
+    The children rows are filled when their parent row is expanded."""
+
+    def __init__(self, group, children_field=None, children_definitions=None):
+        super().__init__(GObject.TYPE_PYOBJECT)
+        self.group = group
+        self.children_field = children_field
+        self.children_definitions = children_definitions or []
+        # The children group of the filled rows by record, both are weakly
+        # referenced as the group references its parent record
+        self.__filled = weakref.WeakKeyDictionary()
+        self.__fill(None, group)
+
+    def __fill(self, parent, group):
+        for record in group:
+            self.__insert(parent, -1, record)
+
+    def __insert(self, parent, position, record):
+        iter_ = Gtk.TreeStore.insert(self, parent, position, [record])
+        if self.__has_child(record):
+            # The placeholder row shows the expander
+            Gtk.TreeStore.append(self, iter_, [None])
+        return iter_
+
+    def __has_child(self, record):
+        if not self.children_field:
+            return False
+        if (record.model_name not in self.children_definitions
+                or self.children_field not in
+                self.children_definitions[record.model_name]):
+            return False
+        return bool(record.children_group(
+                self.children_field, self.children_definitions))
+
+    def __get_iter(self, record):
+        "Return the iter of the record or None if it has no row"
+        try:
+            iter_ = self.get_iter(record.get_index_path(self.group))
+        except (ValueError, AttributeError):
+            return None
+        if self.get_value(iter_, 0) is not record:
+            return None
+        return iter_
+
+    def __filled_row(self, iter_):
+        child = self.iter_children(iter_)
+        return child is None or self.get_value(child, 0) is not None
+
+    def populate(self, iter_):
+        "Fill the children rows of the row in place of the placeholder"
+        if self.__filled_row(iter_):
+            return
+        placeholder = self.iter_children(iter_)
+        record = self.get_value(iter_, 0)
+        children = record.children_group(
+            self.children_field, self.children_definitions)
+        # Fill before removing the placeholder to keep the expander
+        self.__fill(iter_, children or [])
+        Gtk.TreeStore.remove(self, placeholder)
+        self.__filled[record] = self.__ref(children)
+
+    @staticmethod
+    def __ref(group):
+        return weakref.ref(group) if group is not None else None
+
+    def refresh(self):
+        "Fill again the rows whose children group has been replaced"
+        for record, children in list(self.__filled.items()):
+            if children is not None:
+                children = children()
+            group = record.value.get(self.children_field)
+            if group is children:
+                continue
+            iter_ = self.__get_iter(record)
+            if iter_ is None:
+                del self.__filled[record]
+                continue
+            length = self.iter_n_children(iter_)
+            # Fill before removing the rows to keep the row expanded
+            self.__fill(iter_, group or [])
+            for _ in range(length):
+                Gtk.TreeStore.remove(self, self.iter_children(iter_))
+            self.__filled[record] = self.__ref(group)
+
+    def added(self, group, record):
+        if (group is self.group
+                and (record.group is self.group
+                    or record.group.child_name == self.children_field)):
+            parent = None
+            if record.group is not self.group:
+                parent = self.__get_iter(record.parent)
+                # The rows are added when the parent row is filled
+                if parent is None or not self.__filled_row(parent):
+                    return
+            self.__insert(parent, record.group.index(record), record)
+
+    def removed(self, group, record):
+        if (group is self.group
+                and (record.group is self.group
+                    or record.group.child_name == self.children_field)):
+            self.__filled.pop(record, None)
+            iter_ = self.__get_iter(record)
+            if iter_ is not None:
+                Gtk.TreeStore.remove(self, iter_)
+
+    def remove(self, iter_):
+        record = self.get_value(iter_, 0)
+        record.group.remove(record)
+
+    def sort(self, ids):
+        self.reorder(None, _sort_group(self.group, ids))
+
+
 class TreeXMLViewParser(XMLViewParser):
 
     WIDGETS = {
@@ -519,6 +646,7 @@ class ViewTree(View):
         self.sum_widgets = []
         self.sum_box = Gtk.HBox()
         self.treeview = None
+        self._prefetch_id = None
         self._editable = bool(int(xml.getAttribute('editable') or 0))
         self._creatable = bool(int(xml.getAttribute('creatable') or 1))
         if self._editable:
@@ -556,6 +684,7 @@ class ViewTree(View):
         self.widget = Gtk.VBox()
         self.scroll = scroll = Gtk.ScrolledWindow()
         scroll.add(self.treeview)
+        scroll.get_vadjustment().connect('value-changed', self._scrolled)
         scroll.set_policy(
             Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
         scroll.set_placement(Gtk.CornerType.TOP_LEFT)
@@ -599,6 +728,20 @@ class ViewTree(View):
             column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
             self.treeview.append_column(column)
 
+    def _scrolled(self, adjustment):
+        visible = self.treeview.get_visible_range()
+        if not visible:
+            return
+        start, end = visible
+        self.group.read_ahead.scrolled(start[0], end[0])
+        if self._prefetch_id is None:
+            self._prefetch_id = GLib.idle_add(self._prefetch)
+
+    def _prefetch(self):
+        self._prefetch_id = None
+        self.group.prefetch()
+        return False
+
     def optional_menu(self, column):
         def toggle(menuitem, column):
             column.set_visible(menuitem.get_active())
@@ -664,7 +807,9 @@ class ViewTree(View):
         model = self.treeview.get_model()
         unsaved_records = [x for x in model.group if x.id < 0]
         search_string = self.screen.screen_container.get_text() or ''
-        if (self.screen.search_count == len(model)
+        complete = (self.screen.search_count == len(model)
+            and not self.screen.search_counting)
+        if (complete
                 or unsaved_records
                 or self.screen.parent):
             ids = self.screen.search_filter(
@@ -782,6 +927,8 @@ class ViewTree(View):
 
     def test_expand_row(self, widget, iter_, path):
         model = widget.get_model()
+        if isinstance(model, StoreModelGroup):
+            model.populate(iter_)
         iter_ = model.iter_children(iter_)
         if not iter_:
             return False
@@ -1088,6 +1235,9 @@ class ViewTree(View):
             self.screen.tree_column_width[model_name].update(fields)
 
     def destroy(self):
+        if self._prefetch_id is not None:
+            GLib.source_remove(self._prefetch_id)
+            self._prefetch_id = None
         self.save_width()
         self.treeview.destroy()
 
@@ -1185,7 +1335,11 @@ class ViewTree(View):
         if (force
                 or not self.treeview.get_model()
                 or self.group != self.treeview.get_model().group):
-            model = AdaptModelGroup(self.group, self.children_field,
+            if CONFIG['client.tree_model'] == 'store':
+                Model = StoreModelGroup
+            else:
+                Model = AdaptModelGroup
+            model = Model(self.group, self.children_field,
                 self.children_definitions)
             self.treeview.set_model(model)
             # __select_changed resets current_record to None
@@ -1198,6 +1352,8 @@ class ViewTree(View):
                     selection.select_path(path)
             # The search column must be set each time the model is changed
             self.treeview.set_search_column(0)
+        elif isinstance(self.treeview.get_model(), StoreModelGroup):
+            self.treeview.get_model().refresh()
         if not current_record:
             selection = self.treeview.get_selection()
             selection.unselect_all()
@@ -216,7 +216,8 @@ class Affix(Cell):
                 value = self.icon
             if self.attrs.get('icon_type') == 'url':
                 pixbuf = common.IconFactory.get_pixbuf_url(
-                    value, size_param=self.attrs.get('url_size'))
+                    value, size_param=self.attrs.get('url_size'),
+                    callback=self._url_loaded)
             else:
                 pixbuf = common.IconFactory.get_pixbuf(
                     value, Gtk.IconSize.BUTTON)
@@ -228,6 +229,11 @@ class Affix(Cell):
             cell.set_property('text', text)
         self._set_visual(cell, record)
 
+    def _url_loaded(self):
+        treeview = self.view.treeview
+        treeview.display_counter += 1  # Force a display
+        treeview.queue_draw()
+
     def clicked(self, renderer, path):
         record, field = self._get_record_field_from_path(path)
         value = record[self.attrs['name']].get(record)
@@ -710,8 +716,11 @@ class _BinarySave(_BinaryIcon):
         filename = file_selection(_('Save As...'), filename=filename,
             action=Gtk.FileChooserAction.SAVE)
         if filename:
-            with open(filename, 'wb') as fp:
-                fp.write(self.binary.get_data(record, field))
+            if hasattr(field, 'save_data'):
+                field.save_data(record, filename)
+            else:
+                with open(filename, 'wb') as fp:
+                    fp.write(self.binary.get_data(record, field))
 
     @realized
     @CellCache.cache
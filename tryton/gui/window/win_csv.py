@@ -318,6 +318,28 @@ class WinCSV(NoModal):
     def get_encoding(self):
         return self.csv_enc.get_active_text() or 'utf_8_sig'
 
+    def progress(self, text, cancel):
+        """Show a progress dialog which sets the cancel event
+        Return the dialog and the function to update it from the main loop"""
+        dialog = Gtk.MessageDialog(
+            transient_for=self.parent, modal=True,
+            destroy_with_parent=True, message_type=Gtk.MessageType.INFO,
+            buttons=Gtk.ButtonsType.CANCEL, text=text)
+        progressbar = Gtk.ProgressBar(show_text=True)
+        dialog.get_message_area().pack_start(
+            progressbar, expand=False, fill=True, padding=0)
+        dialog.connect('response', lambda *a: cancel.set())
+        dialog.show_all()
+
+        def update(count, total):
+            progressbar.set_fraction(count / total if total else 1)
+            progressbar.set_text(_('%(count)d / %(total)d') % {
+                    'count': count,
+                    'total': total,
+                    })
+            return False
+        return dialog, update
+
     def destroy(self):
         super(WinCSV, self).destroy()
         self.dialog.destroy()
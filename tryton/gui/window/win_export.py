@@ -6,13 +6,17 @@ import datetime
 import gettext
 import json
 import locale
+import logging
 import os
 import tempfile
+import threading
 import urllib.parse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from itertools import zip_longest
 from numbers import Number
 
-from gi.repository import Gdk, GObject, Gtk
+from gi.repository import Gdk, GLib, GObject, Gtk
 
 import tryton.common as common
 from tryton.common import RPCException, RPCExecute
@@ -22,6 +26,7 @@ from tryton.jsonrpc import JSONEncoder
 from tryton.rpc import CONNECTION, clear_cache
 
 _ = gettext.gettext
+logger = logging.getLogger(__name__)
 
 
 class WinExport(WinCSV):
@@ -356,7 +361,9 @@ class WinExport(WinCSV):
                 domain = self.screen.search_domain(
                     self.screen.screen_container.get_text())
                 if self.ignore_search_limit.get_active():
-                    offset, limit = 0, None
+                    self.export_csv_stream(fields2, fields, domain)
+                    self.destroy()
+                    return
                 else:
                     offset, limit = self.screen.offset, self.screen.limit
                 try:
@@ -408,6 +415,116 @@ class WinExport(WinCSV):
             common.warning(str(exception), _('Export failed'))
             return False
 
+    def export_csv_stream(self, fields, fields_names, domain):
+        "Export the records of the domain by chunks from a worker thread"
+        if self.saveas.get_active():
+            fname = common.file_selection(_('Save As...'),
+                    action=Gtk.FileChooserAction.SAVE)
+            if not fname:
+                return
+            popup = True
+        else:
+            fileno, fname = tempfile.mkstemp(
+                '.csv', common.slugify(self.name) + '_')
+            os.close(fileno)
+            popup = False
+        # Widgets must not be read from the worker
+        options = {
+            'encoding': self.get_encoding(),
+            'quotechar': self.get_quotechar(),
+            'delimiter': self.get_delimiter(),
+            'add_field_names': self.add_field_names.get_active(),
+            'locale_format': self.csv_locale.get_active(),
+            }
+        model, context, order = self.model, self.context, self.screen.order
+        cancel = threading.Event()
+        progress, update = self.progress(
+            _('Exporting %s') % self.name, cancel)
+
+        def done(count, exception):
+            progress.destroy()
+            if exception:
+                common.warning(str(exception), _('Export failed'))
+            elif cancel.is_set():
+                pass
+            elif popup:
+                if count == 1:
+                    common.message(_('%d record saved.') % count)
+                else:
+                    common.message(_('%d records saved.') % count)
+            else:
+                common.file_open(fname, 'csv')
+            return False
+
+        def run():
+            count, exception = 0, None
+            try:
+                count = self._export_stream(
+                    fname, model, fields, fields_names, domain, order,
+                    context, cancel, update, **options)
+            except Exception as e:
+                logger.debug("Export failed", exc_info=True)
+                exception = e
+            if exception or cancel.is_set():
+                try:
+                    os.remove(fname)
+                except OSError:
+                    pass
+            GLib.idle_add(done, count, exception)
+        threading.Thread(target=run, daemon=True).start()
+
+    @classmethod
+    def _export_stream(
+            cls, fname, model, fields, fields_names, domain, order, context,
+            cancel, update, encoding, quotechar, delimiter, add_field_names,
+            locale_format):
+        """Write the CSV of the records by chunks of ids
+        The chunks are fetched by parallel workers but written in order."""
+        ids = RPCExecute('model', model, 'search', domain, 0, None, order,
+            context=context, process_exception=False)
+        total = len(ids)
+        size = int(CONFIG['client.export_chunk'])
+        chunks = (ids[i:i + size] for i in range(0, total, size))
+        workers = max(int(CONFIG['client.export_workers']), 1)
+        GLib.idle_add(update, 0, total)
+
+        def fetch(chunk):
+            return chunk, RPCExecute('model', model, 'export_data',
+                chunk, fields_names, context=context, process_exception=False)
+
+        count = 0
+        with open(fname, 'w', encoding=encoding, newline='') as file_obj, \
+                ThreadPoolExecutor(max_workers=workers) as executor:
+            writer = csv.writer(
+                file_obj, quotechar=quotechar, delimiter=delimiter)
+            if add_field_names:
+                writer.writerow(fields)
+            # Keep a bounded number of chunks in memory
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(fetch, chunk))
+                if len(pending) < 2 * workers:
+                    continue
+                count += cls._write_chunk(
+                    writer, pending.popleft().result(), locale_format)
+                GLib.idle_add(update, count, total)
+                if cancel.is_set():
+                    break
+            while pending and not cancel.is_set():
+                count += cls._write_chunk(
+                    writer, pending.popleft().result(), locale_format)
+                GLib.idle_add(update, count, total)
+            for future in pending:
+                future.cancel()
+        return count
+
+    @classmethod
+    def _write_chunk(cls, writer, result, locale_format):
+        chunk, data = result
+        for row in data:
+            writer.writerow(cls.format_row(row, locale_format=locale_format))
+        return len(chunk)
+
     @classmethod
     def format_row(cls, line, indent=0, locale_format=True):
         row = []
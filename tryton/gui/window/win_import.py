@@ -2,18 +2,77 @@
 # this repository contains the full copyright notices and license terms.
 import base64
 import csv
+import functools
 import gettext
+import hashlib
+import json
 import locale
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 
-from gi.repository import Gtk
+from gi.repository import GLib, Gtk
 
 import tryton.common as common
 from tryton.common import RPCException, RPCExecute
 from tryton.common.datetime_ import date_parse
+from tryton.config import CONFIG, get_config_dir
 from tryton.gui.window.win_csv import WinCSV
 
 _ = gettext.gettext
+logger = logging.getLogger(__name__)
+
+
+class BatchImportError(Exception):
+    "Error of the import of a batch of rows"
+
+    def __init__(self, start, end, exception):
+        super().__init__(start, end, exception)
+        self.start = start
+        self.end = end
+        self.exception = exception
+
+
+class _ImportState(object):
+    "Store on disk the batches of a file already imported"
+
+    def __init__(self, fname, fields, skip, size):
+        stat = os.stat(fname)
+        key = json.dumps([
+                os.path.abspath(fname), stat.st_size, stat.st_mtime,
+                fields, skip, size])
+        self.path = os.path.join(
+            get_config_dir(), 'import',
+            hashlib.sha1(key.encode('utf-8')).hexdigest())
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, 'r') as file_obj:
+                self.done = set(json.load(file_obj))
+        except (IOError, ValueError):
+            self.done = set()
+
+    def add(self, start):
+        with self._lock:
+            self.done.add(start)
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path + '.tmp', 'w') as file_obj:
+                    json.dump(sorted(self.done), file_obj)
+                os.replace(self.path + '.tmp', self.path)
+            except OSError:
+                logger.warning(
+                    "Unable to store import state %s", self.path,
+                    exc_info=True)
+
+    def clear(self):
+        self.done = set()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
 
 
 class WinImport(WinCSV):
@@ -191,42 +250,164 @@ class WinImport(WinCSV):
         # TODO: make it works with references
         skip = self.csv_skip.get_value_as_int()
         encoding = self.get_encoding()
-        locale_format = self.csv_locale.get_active()
+        quotechar = self.get_quotechar()
+        delimiter = self.get_delimiter()
+        converters = self.get_converters(
+            fields, self.csv_locale.get_active())
+        size = int(CONFIG['client.import_chunk'])
         try:
+            with open(fname, 'r', encoding=encoding, newline='') as file_obj:
+                total = sum(1 for _ in csv.reader(
+                        file_obj, quotechar=quotechar, delimiter=delimiter))
+            state = _ImportState(fname, fields, skip, size)
+        except (IOError, UnicodeError, csv.Error) as exception:
+            common.warning(str(exception), _("Import failed"))
+            return
+        if state.done and not common.sur(
+                _("The previous import of this file was interrupted.\n"
+                    "Do you want to resume it?")):
+            state.clear()
+
+        batches = self.read_batches(
+            fname, fields, converters, skip, size,
+            encoding, quotechar, delimiter)
+        model, context = self.model, self.context
+        cancel = threading.Event()
+        progress, update = self.progress(
+            _('Importing %s') % self.name, cancel)
+
+        def done(count, exception):
+            progress.destroy()
+            if isinstance(exception, BatchImportError):
+                try:
+                    common.process_exception(exception.exception)
+                except RPCException:
+                    pass
+                common.warning(
+                    _("Rows %(start)d to %(end)d could not be imported.\n"
+                        "The import can be resumed.") % {
+                        'start': exception.start + 1,
+                        'end': exception.end,
+                        }, _("Import failed"))
+            elif exception:
+                common.warning(str(exception), _("Import failed"))
+            elif not cancel.is_set():
+                state.clear()
+                if count == 1:
+                    common.message(_('%d record imported.') % count)
+                else:
+                    common.message(_('%d records imported.') % count)
+            return False
+
+        def run():
+            count, exception = 0, None
+            try:
+                count = self._import_stream(
+                    model, fields, batches, state, context, cancel,
+                    functools.partial(update, total=total))
+            except Exception as e:
+                logger.debug("Import failed", exc_info=True)
+                exception = e
+            GLib.idle_add(done, count, exception)
+        threading.Thread(target=run, daemon=True).start()
+
+    def get_converters(self, fields, locale_format):
+        "Return the function to convert the values of each column"
+        def converter(function):
+            return lambda value: function(value) if value else value
+
+        def identity(value):
+            return value
+
+        converters = []
+        for field in fields:
+            type_ = self.fields_data[field]['type']
+            if not locale_format:
+                function = identity
+            elif type_ in ['integer', 'biginteger']:
+                function = converter(locale.atoi)
+            elif type_ == 'float':
+                function = converter(locale.atof)
+            elif type_ == 'numeric':
+                function = converter(
+                    lambda v: Decimal(locale.delocalize(v)))
+            elif type_ in ['date', 'datetime']:
+                function = converter(
+                    lambda v: date_parse(v, common.date_format()))
+            elif type_ == 'binary':
+                function = converter(base64.b64decode)
+            else:
+                function = identity
+            converters.append(function)
+        return converters
+
+    @staticmethod
+    def read_batches(
+            fname, fields, converters, skip, size,
+            encoding, quotechar, delimiter):
+        """Yield the range of line numbers and the converted rows by batch
+        of size. A batch is ended only before a row starting a new record."""
+        # The rows of the x2many fields have no value for the main fields
+        mains = [i for i, f in enumerate(fields) if '/' not in f]
+        with open(fname, 'r', encoding=encoding, newline='') as file_obj:
             reader = csv.reader(
-                open(fname, 'r', encoding=encoding),
-                quotechar=self.get_quotechar(),
-                delimiter=self.get_delimiter())
-            data = []
+                file_obj, quotechar=quotechar, delimiter=delimiter)
+            start, end, batch = None, None, []
             for i, line in enumerate(reader):
                 if i < skip or not line:
                     continue
-                row = []
-                for field, val in zip(fields, line):
-                    if locale_format and val:
-                        type_ = self.fields_data[field]['type']
-                        if type_ in ['integer', 'biginteger']:
-                            val = locale.atoi(val)
-                        elif type_ == 'float':
-                            val = locale.atof(val)
-                        elif type_ == 'numeric':
-                            val = Decimal(locale.delocalize(val))
-                        elif type_ in ['date', 'datetime']:
-                            val = date_parse(val, common.date_format())
-                        elif type_ == 'binary':
-                            val = base64.b64decode(val)
-                    row.append(val)
-                data.append(row)
-        except (IOError, UnicodeDecodeError, csv.Error) as exception:
-            common.warning(str(exception), _("Import failed"))
-            return
-        try:
-            count = RPCExecute(
-                'model', self.model, 'import_data', fields, data,
-                context=self.context)
-        except RPCException:
-            return
-        if count == 1:
-            common.message(_('%d record imported.') % count)
-        else:
-            common.message(_('%d records imported.') % count)
+                if (len(batch) >= size
+                        and any(line[j] for j in mains if j < len(line))):
+                    yield start, end, batch
+                    start, batch = None, []
+                if start is None:
+                    start = i
+                end = i + 1
+                batch.append(
+                    [c(v) for c, v in zip(converters, line)])
+            if batch:
+                yield start, end, batch
+
+    @staticmethod
+    def _import_stream(model, fields, batches, state, context, cancel, update):
+        """Send the batches to import_data with parallel workers
+        The batches already imported according to state are skipped."""
+        workers = max(int(CONFIG['client.import_workers']), 1)
+        count, line = 0, 0
+        pending = deque()
+
+        def collect():
+            nonlocal count, line
+            start, end, future = pending.popleft()
+            try:
+                count += future.result()
+            except Exception as exception:
+                raise BatchImportError(start, end, exception)
+            state.add(start)
+            line = max(line, end)
+            GLib.idle_add(update, line)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                for start, end, batch in batches:
+                    if start in state.done:
+                        line = max(line, end)
+                        continue
+                    if cancel.is_set():
+                        break
+                    pending.append((start, end, executor.submit(
+                                RPCExecute, 'model', model, 'import_data',
+                                fields, batch, context=context,
+                                process_exception=False)))
+                    if len(pending) >= 2 * workers:
+                        collect()
+                while pending:
+                    collect()
+            except BatchImportError:
+                # Record the batches committed concurrently
+                for start, end, future in pending:
+                    if (not future.cancel()
+                            and future.exception() is None):
+                        state.add(start)
+                raise
+        return count
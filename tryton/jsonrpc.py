@@ -7,34 +7,28 @@ import hashlib
 import http.client
 import json
 import logging
+import os
+import select
+import shutil
 import socket
 import ssl
 import threading
+import time
 import urllib
 import xmlrpc.client
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from contextlib import contextmanager
 from decimal import Decimal
 from functools import partial, reduce
 from urllib.parse import quote, urljoin, urlparse
 
-__all__ = ["ResponseError", "Fault", "ProtocolError", "Transport",
-    "ServerProxy", "ServerPool"]
+__all__ = ["ResponseError", "Fault", "ProtocolError", "BatchError",
+    "Transport", "ServerProxy", "ServerPool", "TLSCache"]
 CONNECT_TIMEOUT = 5
 DEFAULT_TIMEOUT = None
 logger = logging.getLogger(__name__)
 
 
-def deepcopy(obj):
-    """Recursively copy python mutable datastructures"""
-    if isinstance(obj, (list, tuple)):
-        return [deepcopy(o) for o in obj]
-    elif isinstance(obj, dict):
-        return {k: deepcopy(v) for k, v in obj.items()}
-    else:
-        return obj
-
-
 class ResponseError(xmlrpc.client.ResponseError):
     pass
 
@@ -53,6 +47,11 @@ class ProtocolError(xmlrpc.client.ProtocolError):
     pass
 
 
+class BatchError(ResponseError):
+    "The server does not support batch requests"
+    pass
+
+
 def object_hook(dct):
     if '__class__' in dct:
         if dct['__class__'] == 'datetime':
@@ -102,7 +101,7 @@ class JSONEncoder(json.JSONEncoder):
             return {'__class__': 'timedelta',
                 'seconds': obj.total_seconds(),
                 }
-        elif isinstance(obj, bytes):
+        elif isinstance(obj, (bytes, bytearray, memoryview)):
             return {'__class__': 'bytes',
                 'base64': base64.encodebytes(obj).decode('utf-8'),
                 }
@@ -136,17 +135,52 @@ class JSONUnmarshaller(object):
         return json.loads(''.join(self.data), object_hook=object_hook)
 
 
+class HTTPSConnection(http.client.HTTPSConnection):
+    "HTTPS connection which tries to resume a previous TLS session"
+    tls_session = None
+
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+        if self._tunnel_host:
+            server_hostname = self._tunnel_host
+        else:
+            server_hostname = self.host
+        self.sock = self._context.wrap_socket(
+            self.sock, server_hostname=server_hostname,
+            session=self.tls_session)
+
+
+class TLSCache(object):
+    "Share the SSL context and the TLS sessions between connections"
+
+    def __init__(self, ca_certs=None):
+        self._ca_certs = ca_certs
+        self._context = None
+        self._lock = threading.Lock()
+        self.sessions = {}
+        self.fingerprints = {}
+
+    @property
+    def context(self):
+        with self._lock:
+            if self._context is None:
+                self._context = ssl.create_default_context(
+                    cafile=self._ca_certs)
+            return self._context
+
+
 class Transport(xmlrpc.client.SafeTransport):
 
     accept_gzip_encoding = True
     encode_threshold = 1400  # common MTU
 
     def __init__(
-            self, fingerprints=None, ca_certs=None, session=None):
+            self, fingerprints=None, ca_certs=None, session=None, tls=None):
         xmlrpc.client.Transport.__init__(self)
         self._connection = (None, None)
         self.__fingerprints = fingerprints
         self.__ca_certs = ca_certs
+        self.__tls = tls
         self.session = session
         self.set_proxies()
 
@@ -200,7 +234,7 @@ class Transport(xmlrpc.client.SafeTransport):
         if hasattr(response, 'getheader'):
             cache = int(response.getheader('X-Tryton-Cache', 0))
         response = super().parse_response(response)
-        if cache:
+        if cache and isinstance(response, dict):
             try:
                 response['cache'] = int(cache)
             except ValueError:
@@ -236,7 +270,10 @@ class Transport(xmlrpc.client.SafeTransport):
             return self._connection[1]
         chost, self._extra_headers, x509 = self.get_host_info(host)
 
-        ssl_ctx = ssl.create_default_context(cafile=self.__ca_certs)
+        if self.__tls is not None:
+            ssl_ctx = self.__tls.context
+        else:
+            ssl_ctx = ssl.create_default_context(cafile=self.__ca_certs)
 
         def set_connection(ConnectionClass):
             if self.http_proxy:
@@ -261,23 +298,33 @@ class Transport(xmlrpc.client.SafeTransport):
             sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
 
         def https_connection(allow_http=False):
-            self._connection = host, http.client.HTTPSConnection(chost,
+            connection = HTTPSConnection(chost,
                 timeout=CONNECT_TIMEOUT, context=ssl_ctx)
+            if self.__tls is not None:
+                connection.tls_session = self.__tls.sessions.get(chost)
+            self._connection = host, connection
             try:
-                self._connection[1].connect()
-                sock = self._connection[1].sock
+                connection.connect()
+                sock = connection.sock
                 sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
                 sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
                 try:
                     peercert = sock.getpeercert(True)
                 except socket.error:
                     peercert = None
+                if self.__tls is not None:
+                    self.__tls.sessions[chost] = sock.session
+                    if peercert is None and sock.session_reused:
+                        return self.__tls.fingerprints.get(chost, '')
 
                 def format_hash(value):
                     return reduce(lambda x, y: x + y[1].upper()
                         + ((y[0] % 2 and y[0] + 1 < len(value)) and ':' or ''),
                         enumerate(value), '')
-                return format_hash(hashlib.sha1(peercert).hexdigest())
+                fingerprint = format_hash(hashlib.sha1(peercert).hexdigest())
+                if self.__tls is not None:
+                    self.__tls.fingerprints[chost] = fingerprint
+                return fingerprint
             except (socket.error, ssl.SSLError, ssl.CertificateError):
                 if allow_http:
                     http_connection()
@@ -300,21 +347,36 @@ class Transport(xmlrpc.client.SafeTransport):
         self._connection[1].sock.settimeout(DEFAULT_TIMEOUT)
         return self._connection[1]
 
+    def is_alive(self):
+        "Test if the kept-alive socket was not closed by the server"
+        connection = self._connection[1]
+        if connection is None or connection.sock is None:
+            return True
+        try:
+            readable, _, _ = select.select([connection.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        # An idle HTTP connection becomes readable only on EOF
+        return not readable
+
 
 class ServerProxy(xmlrpc.client.ServerProxy):
     __id = 0
 
     def __init__(self, host, port, database='', verbose=0,
-            fingerprints=None, ca_certs=None, session=None, cache=None):
+            fingerprints=None, ca_certs=None, session=None, cache=None,
+            tls=None):
         self.__host = '%s:%s' % (host, port)
         if database:
             database = quote(database)
             self.__handler = '/%s/' % database
         else:
             self.__handler = '/'
-        self.__transport = Transport(fingerprints, ca_certs, session)
+        self.__transport = Transport(fingerprints, ca_certs, session, tls)
         self.__verbose = verbose
         self.__cache = cache
+        self.request_count = 0
+        self.last_used = time.monotonic()
 
     def __request(self, methodname, params):
         dumper = partial(json.dumps, cls=JSONEncoder, separators=(',', ':'))
@@ -331,9 +393,27 @@ class ServerProxy(xmlrpc.client.ServerProxy):
                 'params': params,
                 }).encode('utf-8')
 
+        try:
+            response = self.__send(request)
+        except xmlrpc.client.ProtocolError as e:
+            raise Fault(str(e.errcode), e.errmsg)
+        if response['id'] != id_:
+            raise ResponseError('Invalid response id (%s) excpected %s' %
+                (response['id'], id_))
+        if response.get('error'):
+            raise Fault(*response['error'])
+        if self.__cache and response.get('cache'):
+            self.__cache.set(
+                methodname, dumper(params), response['cache'],
+                response['result'])
+        return response['result']
+
+    def __send(self, request):
+        self.request_count += 1
+        self.last_used = time.monotonic()
         try:
             try:
-                response = self.__transport.request(
+                return self.__transport.request(
                     self.__host,
                     self.__handler,
                     request,
@@ -345,31 +425,78 @@ class ServerProxy(xmlrpc.client.ServerProxy):
                     raise
                 # try one more time
                 self.__transport.close()
-                response = self.__transport.request(
+                return self.__transport.request(
                     self.__host,
                     self.__handler,
                     request,
                     verbose=self.__verbose
                     )
-        except xmlrpc.client.ProtocolError as e:
-            raise Fault(str(e.errcode), e.errmsg)
+        except xmlrpc.client.ProtocolError:
+            raise
         except Exception:
             self.__transport.close()
             raise
-        if response['id'] != id_:
-            raise ResponseError('Invalid response id (%s) excpected %s' %
-                (response['id'], id_))
-        if response.get('error'):
-            raise Fault(*response['error'])
-        if self.__cache and response.get('cache'):
-            self.__cache.set(
-                methodname, dumper(params), response['cache'],
-                response['result'])
-        return response['result']
+
+    def batch(self, calls):
+        """Execute the calls, a list of (methodname, params), in one request
+        Return the list of results or Fault instances.
+        Raise BatchError if the server does not support batch requests."""
+        dumper = partial(json.dumps, cls=JSONEncoder, separators=(',', ':'))
+        results = [None] * len(calls)
+        requests, pending = [], {}
+        for i, (methodname, params) in enumerate(calls):
+            if self.__cache and self.__cache.cached(methodname):
+                try:
+                    results[i] = self.__cache.get(methodname, dumper(params))
+                    continue
+                except KeyError:
+                    pass
+            self.__id += 1
+            requests.append({
+                    'id': self.__id,
+                    'method': methodname,
+                    'params': params,
+                    })
+            pending[self.__id] = i
+        if not requests:
+            return results
+        request = dumper(requests).encode('utf-8')
+
+        try:
+            responses = self.__send(request)
+        except xmlrpc.client.ProtocolError as e:
+            if e.errcode in {401, 403}:
+                raise Fault(str(e.errcode), e.errmsg)
+            raise BatchError('Batch rejected (%s)' % e.errcode)
+        if not isinstance(responses, list):
+            raise BatchError('Invalid batch response')
+        for response in responses:
+            try:
+                i = pending.pop(response['id'])
+            except KeyError:
+                raise ResponseError(
+                    'Invalid response id (%s)' % response['id'])
+            if response.get('error'):
+                results[i] = Fault(*response['error'])
+                continue
+            methodname, params = calls[i]
+            if self.__cache and response.get('cache'):
+                self.__cache.set(
+                    methodname, dumper(params), response['cache'],
+                    response['result'])
+            results[i] = response['result']
+        if pending:
+            raise ResponseError(
+                'Missing response ids %s' % ', '.join(map(str, pending)))
+        return results
 
     def close(self):
         self.__transport.close()
 
+    @property
+    def alive(self):
+        return self.__transport.is_alive()
+
     @property
     def ssl(self):
         return isinstance(self.__transport.make_connection(self.__host),
@@ -382,12 +509,23 @@ class ServerProxy(xmlrpc.client.ServerProxy):
 
 
 class ServerPool(object):
-    keep_max = 4
+    keep_min = 1
+    keep_max = 16
+    idle_timeout = 5 * 60
     _cache = None
+    # None until the first batch request tells if the server supports it
+    batch_supported = None
 
     def __init__(self, host, port, database, *args, **kwargs):
+        for name in ['keep_min', 'keep_max', 'idle_timeout']:
+            value = kwargs.pop(name, None)
+            if value is not None:
+                setattr(self, name, value)
+        cache_size = kwargs.pop('cache_size', None)
+        cache_path = kwargs.pop('cache_path', None)
         if kwargs.get('cache'):
-            self._cache = kwargs['cache'] = _Cache()
+            self._cache = kwargs['cache'] = _Cache(cache_size, cache_path)
+        kwargs['tls'] = TLSCache(kwargs.get('ca_certs'))
         self.ServerProxy = partial(
             ServerProxy, host, port, database, *args, **kwargs)
 
@@ -396,28 +534,69 @@ class ServerPool(object):
         self._database = database
 
         self._lock = threading.Lock()
+        # Sorted from the least to the most recently used
         self._pool = []
         self._used = {}
+        self._stats = defaultdict(int)
         self.session = kwargs.get('session')
 
     def getconn(self):
         with self._lock:
-            if self._pool:
+            self._prune()
+            conn = None
+            while self._pool:
                 conn = self._pool.pop()
-            else:
+                if conn.alive:
+                    self._stats['reused'] += 1
+                    break
+                conn.close()
+                self._stats['dead'] += 1
+                conn = None
+            if conn is None:
                 conn = self.ServerProxy()
+                self._stats['created'] += 1
             self._used[id(conn)] = conn
+            self._stats['peak'] = max(self._stats['peak'], len(self._used))
             return conn
 
     def putconn(self, conn):
         with self._lock:
             self._pool.append(conn)
             del self._used[id(conn)]
-
-            # Remove oldest connections
-            while len(self._pool) > self.keep_max:
-                conn = self._pool.pop()
-                conn.close()
+            self._prune()
+
+    def _prune(self):
+        "Close the idle connections which are expired or in excess"
+        now = time.monotonic()
+        while (len(self._pool) > self.keep_min
+                and now - self._pool[0].last_used > self.idle_timeout):
+            self._pool.pop(0).close()
+            self._stats['expired'] += 1
+        while len(self._pool) > self.keep_max:
+            self._pool.pop(0).close()
+            self._stats['discarded'] += 1
+
+    def batch(self, calls):
+        """Execute the calls, a list of (methodname, params), in one round-trip
+        Fall back to sequential calls if the server rejects batch requests.
+        Return the list of results or exception instances."""
+        with self() as conn:
+            if self.batch_supported is not False:
+                try:
+                    results = conn.batch(calls)
+                except BatchError as exception:
+                    logger.info('batch requests not supported: %s', exception)
+                    self.batch_supported = False
+                else:
+                    self.batch_supported = True
+                    return results
+            results = []
+            for methodname, params in calls:
+                try:
+                    results.append(getattr(conn, methodname)(*params))
+                except Exception as exception:
+                    results.append(exception)
+            return results
 
     def close(self):
         with self._lock:
@@ -426,6 +605,22 @@ class ServerPool(object):
             self._pool = []
             self._used.clear()
 
+    def stats(self):
+        "Return the counters of the pool for debugging"
+        with self._lock:
+            now = time.monotonic()
+            stats = dict(self._stats)
+            stats['idle'] = len(self._pool)
+            stats['used'] = len(self._used)
+            stats['connections'] = [{
+                    'requests': conn.request_count,
+                    'idle': now - conn.last_used,
+                    'used': id(conn) in self._used,
+                    } for conn in self._pool + list(self._used.values())]
+        if self._cache:
+            stats['cache'] = self._cache.stats()
+        return stats
+
     @property
     def ssl(self):
         for conn in self._pool + list(self._used.values()):
@@ -447,36 +642,185 @@ class ServerPool(object):
         if self._cache:
             self._cache.clear(prefix)
 
+    def invalidate_cache(self, model):
+        if self._cache:
+            self._cache.invalidate(model)
 
-class _Cache:
 
-    def __init__(self):
+_MUTABLE = object()
+
+
+class _Cache:
+    "LRU cache of the responses bounded by the size of their JSON dump"
+    max_size = 64 * 1024 * 1024
+    sweep_interval = 60
+    # Methods whose responses are also stored on disk
+    persistent_methods = ('fields_view_get', 'fields_get')
+
+    def __init__(self, max_size=None, path=None):
+        if max_size is not None:
+            self.max_size = max_size
+        self.path = path
         self.store = defaultdict(dict)
+        # The values are stored dumped to share them safely between callers
+        # and only the immutable ones are kept decoded
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._swept = time.monotonic()
+        self.size = 0
+        self.counters = defaultdict(int)
 
     def cached(self, prefix):
-        return prefix in self.store
+        return prefix in self.store or self._persistent(prefix)
 
     def set(self, prefix, key, expire, value):
-        if isinstance(expire, (int, float)):
-            expire = datetime.timedelta(seconds=expire)
+        now = time.monotonic()
+        if isinstance(expire, datetime.datetime):
+            expire = expire - datetime.datetime.now()
         if isinstance(expire, datetime.timedelta):
-            expire = datetime.datetime.now() + expire
-        self.store[prefix][key] = (expire, deepcopy(value))
+            expire = expire.total_seconds()
+        data = json.dumps(value, cls=JSONEncoder, separators=(',', ':'))
+        with self._lock:
+            if now - self._swept > self.sweep_interval:
+                self._sweep(now)
+            self._insert(prefix, key, now + expire, data)
+        if self._persistent(prefix):
+            self._dump(prefix, key, time.time() + expire, data)
 
     def get(self, prefix, key):
-        now = datetime.datetime.now()
-        try:
-            expire, value = self.store[prefix][key]
-        except ValueError:
-            raise KeyError
-        if expire < now:
-            self.store.pop(key)
-            raise KeyError
+        now = time.monotonic()
+        with self._lock:
+            entry = self.store[prefix].get(key)
+            if entry is None and self._persistent(prefix):
+                entry = self._load(prefix, key, now)
+                if entry is not None:
+                    self._insert(prefix, key, *entry)
+                    entry = self.store[prefix].get(key, entry + (_MUTABLE,))
+                    self.counters['loads'] += 1
+            if entry is None:
+                self.counters['misses'] += 1
+                raise KeyError(key)
+            expire, data, value = entry
+            if expire < now:
+                self._remove(prefix, key)
+                self._unlink(prefix, key)
+                self.counters['expired'] += 1
+                self.counters['misses'] += 1
+                raise KeyError(key)
+            self._lru.move_to_end((prefix, key))
+            self.counters['hits'] += 1
         logger.info('(cached) %s %s', prefix, key)
-        return deepcopy(value)
+        if value is not _MUTABLE:
+            return value
+        # The callers modify the responses like the fields of
+        # fields_view_get, decoding the dump is the cheapest deep copy
+        return json.loads(data, object_hook=object_hook)
+
+    def _insert(self, prefix, key, expire, data):
+        self._remove(prefix, key)
+        store = self.store[prefix]
+        size = len(key) + len(data)
+        if size > self.max_size:
+            return
+        if data.startswith(('{', '[')):
+            value = _MUTABLE
+        else:
+            value = json.loads(data, object_hook=object_hook)
+        store[key] = (expire, data, value)
+        self._lru[prefix, key] = size
+        self.size += size
+        while self.size > self.max_size:
+            self._remove(*next(iter(self._lru)))
+            self.counters['evictions'] += 1
+
+    def _remove(self, prefix, key):
+        store = self.store.get(prefix)
+        if store and store.pop(key, None) is not None:
+            self.size -= self._lru.pop((prefix, key), 0)
+
+    def _sweep(self, now):
+        "Remove the expired entries"
+        for prefix, store in self.store.items():
+            for key, (expire, _, _) in list(store.items()):
+                if expire < now:
+                    del store[key]
+                    self.size -= self._lru.pop((prefix, key), 0)
+                    self.counters['expired'] += 1
+        self._swept = now
+
+    def _persistent(self, prefix):
+        return bool(self.path) and prefix.endswith(
+            tuple('.' + m for m in self.persistent_methods))
+
+    def _filename(self, prefix, key):
+        return os.path.join(
+            self.path, prefix,
+            hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def _dump(self, prefix, key, expire, data):
+        filename = self._filename(prefix, key)
+        try:
+            os.makedirs(os.path.dirname(filename), 0o700, exist_ok=True)
+            with open(filename + '.tmp', 'w', encoding='utf-8') as fp:
+                fp.write('%s\n%s\n%s' % (expire, key, data))
+            os.replace(filename + '.tmp', filename)
+        except OSError:
+            logger.warning('Unable to write cache file %s', filename)
+
+    def _load(self, prefix, key, now):
+        "Return the entry stored on disk with its monotonic expiration"
+        filename = self._filename(prefix, key)
+        try:
+            with open(filename, encoding='utf-8') as fp:
+                expire = float(fp.readline())
+                stored_key = fp.readline()[:-1]
+                data = fp.read()
+        except (OSError, ValueError):
+            return
+        if stored_key != key:
+            return
+        expire -= time.time()
+        if expire < 0:
+            self._unlink(prefix, key)
+            return
+        return now + expire, data
+
+    def _unlink(self, prefix, key):
+        if self._persistent(prefix):
+            try:
+                os.remove(self._filename(prefix, key))
+            except OSError:
+                pass
 
     def clear(self, prefix=None):
-        if prefix:
-            self.store[prefix].clear()
-        else:
-            self.store.clear()
+        with self._lock:
+            if prefix:
+                for key in self.store[prefix]:
+                    self.size -= self._lru.pop((prefix, key), 0)
+                self.store[prefix].clear()
+            else:
+                self.store.clear()
+                self._lru.clear()
+                self.size = 0
+        if self.path:
+            path = os.path.join(self.path, prefix) if prefix else self.path
+            shutil.rmtree(path, ignore_errors=True)
+
+    def invalidate(self, model):
+        "Remove the entries of the methods of model"
+        start = 'model.%s.' % model
+        with self._lock:
+            prefixes = [p for p in self.store
+                if p.startswith(start) and '.' not in p[len(start):]]
+        for prefix in prefixes:
+            self.clear(prefix)
+
+    def stats(self):
+        "Return the counters of the cache for debugging"
+        with self._lock:
+            stats = dict(self.counters)
+            stats['entries'] = len(self._lru)
+            stats['size'] = self.size
+            stats['prefixes'] = {
+                p: len(s) for p, s in self.store.items() if s}
+            return stats
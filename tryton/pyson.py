@@ -3,7 +3,7 @@
 import datetime
 import json
 from decimal import Decimal
-from functools import reduce
+from functools import lru_cache, reduce
 
 from dateutil.relativedelta import relativedelta
 
@@ -769,3 +769,88 @@ CONTEXT = {
     'true': True,
     'false': False,
 }
+
+
+@lru_cache(maxsize=1024)
+def compile(expr):
+    """Return a function evaluating the encoded PYSON expression
+    against a context like PYSONDecoder(context).decode(expr)"""
+    evaluate, _ = _compile(json.loads(expr))
+    return evaluate
+
+
+@lru_cache(maxsize=1024)
+def eval_names(expr):
+    "Return the names read by the Eval of the encoded PYSON expression"
+    names = set()
+
+    def walk(value):
+        if isinstance(value, dict):
+            if value.get('__class__') == 'Eval':
+                names.add(value['v'])
+            for v in value.values():
+                walk(v)
+        elif isinstance(value, list):
+            for v in value:
+                walk(v)
+    walk(json.loads(expr))
+    return frozenset(names)
+
+
+def _compile(value):
+    "Return the function evaluating the value and if it is constant"
+    if isinstance(value, dict):
+        items = {k: _compile(v) for k, v in value.items()}
+        klass = CONTEXT.get(value.get('__class__'))
+        if klass:
+            return _compile_pyson(klass, value, items), False
+        if not all(c for _, c in items.values()):
+            items = [(k, f) for k, (f, _) in items.items()]
+
+            def evaluate(context):
+                return {k: f(context) for k, f in items}
+            return evaluate, False
+    elif isinstance(value, list):
+        funcs = [_compile(v) for v in value]
+        if not all(c for _, c in funcs):
+            funcs = [f for f, _ in funcs]
+
+            def evaluate(context):
+                return [f(context) for f in funcs]
+            return evaluate, False
+    else:
+        return (lambda context: value), True
+    # Decode a new copy as the caller may modify it
+    dump = json.dumps(value)
+    return (lambda context: json.loads(dump)), True
+
+
+def _compile_pyson(klass, value, items):
+    "Return the function evaluating the PYSON statement"
+    funcs = {k: f for k, (f, _) in items.items()}
+    if klass is Eval and all(c for _, c in items.values()):
+        name, default = value['v'], value['d']
+        if '.' not in name and not isinstance(default, (list, dict)):
+            return lambda context: context.get(name, default)
+    elif klass is Not:
+        v = funcs['v']
+        return lambda context: not v(context)
+    elif klass is Bool:
+        v = funcs['v']
+        return lambda context: bool(v(context))
+    elif klass is And:
+        statements = funcs['s']
+        return lambda context: all(statements(context))
+    elif klass is Or:
+        statements = funcs['s']
+        return lambda context: any(statements(context))
+    elif klass is Equal:
+        s1, s2 = funcs['s1'], funcs['s2']
+        return lambda context: s1(context) == s2(context)
+    elif klass is If:
+        c, t, e = funcs['c'], funcs['t'], funcs['e']
+        return lambda context: t(context) if c(context) else e(context)
+    klass_eval = klass.eval
+    funcs = list(funcs.items())
+    return lambda context: klass_eval(
+        {k: f(context) for k, f in funcs}, context)
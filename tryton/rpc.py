@@ -4,6 +4,7 @@ import http.client
 import logging
 import os
 import socket
+from contextlib import contextmanager
 
 try:
     from http import HTTPStatus
@@ -11,6 +12,7 @@ except ImportError:
     from http import client as HTTPStatus
 
 from functools import partial
+from urllib.parse import quote
 
 from tryton import bus, device_cookie, fingerprints
 from tryton.config import CONFIG, get_config_dir
@@ -39,6 +41,20 @@ ServerPool = partial(ServerPool, fingerprints=fingerprints,
     ca_certs=_CA_CERTS)
 
 
+def _server_pool(hostname, port, database, session):
+    cache_path = None
+    if CONFIG['connection.persistent_cache']:
+        cache_path = os.path.join(get_config_dir(), 'cache', quote(
+                '%s:%s/%s/%s' % (hostname, port, database, _USER), safe=''))
+    return ServerPool(
+        hostname, port, database, session=session, cache=not CONFIG['dev'],
+        keep_min=int(CONFIG['connection.pool_min']),
+        keep_max=int(CONFIG['connection.pool_max']),
+        idle_timeout=int(CONFIG['connection.idle_timeout']),
+        cache_size=int(CONFIG['connection.cache_size']),
+        cache_path=cache_path)
+
+
 def context_reset():
     CONTEXT.clear()
     CONTEXT['client'] = bus.ID
@@ -109,8 +125,7 @@ def set_service_session(parameters):
     session = ':'.join(map(str, [username, user_id, session]))
     if CONNECTION is not None:
         CONNECTION.close()
-    CONNECTION = ServerPool(
-        hostname, port, database, session=session, cache=not CONFIG['dev'])
+    CONNECTION = _server_pool(hostname, port, database, session)
     bus.listen(CONNECTION)
 
 
@@ -136,8 +151,7 @@ def login(parameters):
     session = ':'.join(map(str, [username] + result))
     if CONNECTION is not None:
         CONNECTION.close()
-    CONNECTION = ServerPool(
-        hostname, port, database, session=session, cache=not CONFIG['dev'])
+    CONNECTION = _server_pool(hostname, port, database, session)
     _CLIENT_DATE = date
     device_cookie.renew()
     bus.listen(CONNECTION)
@@ -153,6 +167,7 @@ def logout():
                 conn.common.db.logout()
         except (Fault, socket.error, http.client.CannotSendRequest):
             pass
+        logger.debug('connection stats: %s', CONNECTION.stats())
         CONNECTION.close()
         CONNECTION = None
     _CLIENT_DATE = None
@@ -175,6 +190,81 @@ def execute(*args):
     return result
 
 
+def execute_batch(calls):
+    """Execute the calls, a list of execute arguments, in one round-trip
+    Return the list of results or exception instances."""
+    if CONNECTION is None:
+        raise TrytonServerError('403')
+    calls = [('.'.join(args[:3]), args[3:]) for args in calls]
+    for name, args in calls:
+        logger.info('(batch) %s%s', name, args)
+    try:
+        results = CONNECTION.batch(calls)
+    except (http.client.CannotSendRequest, socket.error) as exception:
+        raise TrytonServerUnavailable(*exception.args)
+    for i, result in enumerate(results):
+        if isinstance(
+                result, (http.client.CannotSendRequest, socket.error)):
+            results[i] = TrytonServerUnavailable(*result.args)
+    logger.debug(repr(results))
+    return results
+
+
+class BatchCall(object):
+    "A call of a batch whose result is available once the batch is sent"
+
+    def __init__(self, args):
+        self.args = args
+        self._result = None
+        self._exception = None
+
+    def set(self, result):
+        if isinstance(result, Exception):
+            self._exception = result
+        else:
+            self._result = result
+
+    def result(self):
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+
+class Batch(object):
+    "Collect execute calls to send them in one round-trip"
+
+    def __init__(self):
+        self.calls = []
+
+    def execute(self, *args):
+        call = BatchCall(args)
+        self.calls.append(call)
+        return call
+
+    def send(self):
+        calls, self.calls = self.calls, []
+        if not calls:
+            return
+        try:
+            results = execute_batch([c.args for c in calls])
+        except Exception as exception:
+            results = [exception] * len(calls)
+        for call, result in zip(calls, results):
+            call.set(result)
+
+
+@contextmanager
+def batch():
+    batch = Batch()
+    yield batch
+    batch.send()
+
+
 def clear_cache(prefix=None):
     if CONNECTION:
         CONNECTION.clear_cache(prefix)
+
+
+def invalidate_cache(model):
+    if CONNECTION:
+        CONNECTION.invalidate_cache(model)
@@ -0,0 +1,85 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+"""Micro-benchmarks of the domain inversion
+
+Run with: python -m tryton.tests.benchmark_domain_inversion
+"""
+import datetime as dt
+import timeit
+
+from tryton.common.domain_inversion import domain_inversion, parse
+
+DOMAINS = {
+    'invoice line': [
+        ['company', '=', 1],
+        ['OR',
+            [['type', '=', 'out'], ['account.type.receivable', '=', True]],
+            [['type', '=', 'in'], ['account.type.payable', '=', True]]],
+        ['product', 'where', [
+                ['type', 'in', ['goods', 'service']],
+                ['active', '=', True]]],
+        ['unit', 'in', [1, 2, 3, 4, 5]],
+        ['quantity', '>=', 0],
+        ['taxes', 'in', [10, 11, 12]],
+        ],
+    'move line': [
+        ['account.company', '=', 1],
+        ['OR',
+            [['debit', '>', 0], ['credit', '=', 0]],
+            [['credit', '>', 0], ['debit', '=', 0]]],
+        ['OR',
+            ['party', '=', None],
+            [['party', '!=', None], ['account.party_required', '=', True]]],
+        ['date', '>=', dt.date(2020, 1, 1)],
+        ['date', '<=', dt.date(2020, 12, 31)],
+        ['state', 'in', ['draft', 'posted']],
+        ],
+    }
+CONTEXT = {
+    'company': 1,
+    'type': 'out',
+    'account': 3,
+    'debit': 10,
+    'credit': 0,
+    'party': 5,
+    'date': dt.date(2020, 6, 1),
+    'state': 'draft',
+    }
+# The contexts of the records of a list
+CONTEXTS = [
+    dict(CONTEXT, debit=i % 3, credit=(i + 1) % 3, party=i % 2 or None,
+        date=dt.date(2020, 1 + i % 12, 1))
+    for i in range(20)]
+
+
+def inverse(domain, symbol, context):
+    "The inversion without compiled domain"
+    expression = parse(domain)
+    if symbol not in expression.variables:
+        return True
+    return expression.inverse(symbol, context)
+
+
+def main(number=100):
+    print('%-12s %-10s %10s %10s %8s' % (
+            'domain', 'symbol', 'parse', 'compiled', 'speedup'))
+    for name, domain in DOMAINS.items():
+        for symbol in ['quantity', 'unit', 'date', 'party', 'debit']:
+            # Each validation inverses the domain for every field
+            parsed = timeit.timeit(
+                lambda: [inverse(domain, symbol, c) for c in CONTEXTS],
+                number=number)
+            compiled = timeit.timeit(
+                lambda: [
+                    domain_inversion(domain, symbol, c) for c in CONTEXTS],
+                number=number)
+            for context in CONTEXTS:
+                assert (inverse(domain, symbol, context)
+                    == domain_inversion(domain, symbol, context))
+            print('%-12s %-10s %9.2fms %9.2fms %7.1fx' % (
+                    name, symbol, parsed * 1000, compiled * 1000,
+                    parsed / compiled))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import json
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from tryton import bus
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        request = json.loads(self.rfile.read(length))
+        self.server.requests.append(request)
+        try:
+            message = self.server.messages.get(timeout=0.2)
+        except queue.Empty:
+            message = None
+        data = json.dumps({'message': message}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StandInBus(ThreadingHTTPServer):
+    "Local bus standing in for trytond"
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('localhost', 0), _Handler)
+        self.requests = []
+        self.messages = queue.Queue()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return 'http://localhost:%s' % self.server_address[1]
+
+    def send(self, message_id, **message):
+        message['message_id'] = message_id
+        self.messages.put(message)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Connection:
+    session = 'admin:1:session'
+
+    def __init__(self, url):
+        self.url = url
+
+
+class BusTestCase(TestCase):
+    "Test bus"
+
+    def setUp(self):
+        self.bus = StandInBus()
+        self.addCleanup(self.bus.stop)
+        self.connection = _Connection(self.bus.url)
+
+    def listen(self, count):
+        "Listen until count messages are handled and return them"
+        handled = []
+        done = threading.Event()
+
+        def idle_add(func, message):
+            handled.append(message)
+            if len(handled) >= count:
+                self.connection.session = None
+                done.set()
+        with patch.object(bus.GLib, 'idle_add', idle_add), \
+                patch.object(bus, 'channels', lambda: ['model:party.party']):
+            listener = threading.Thread(
+                target=bus._listen, args=(self.connection,), daemon=True)
+            listener.start()
+            self.assertTrue(done.wait(5))
+            listener.join(5)
+        return handled
+
+    def test_listen(self):
+        "Test listen dispatches the messages in order"
+        self.bus.send(1, type='notification', title="Foo")
+        self.bus.send(
+            2, type='record', model='party.party', ids=[1, 2],
+            timestamps={'1': 'ts'})
+
+        messages = self.listen(2)
+
+        self.assertEqual(
+            [m['message_id'] for m in messages], [1, 2])
+        self.assertEqual(messages[1]['ids'], [1, 2])
+        self.assertEqual(self.bus.requests[1]['last_message'], 1)
+        self.assertEqual(
+            self.bus.requests[0]['channels'], ['model:party.party'])
+
+    def test_channels(self):
+        "Test channels subscribe to the models of the opened groups"
+        group = Mock(model_name='party.party')
+        with patch('tryton.gui.window.view_form.model.group.Group'
+                '._instances', {id(group): group}):
+            channels = bus.channels()
+
+        self.assertEqual(channels[0], 'client:%s' % bus.ID)
+        self.assertIn('model:party.party', channels)
+        self.assertIn('model:ir.ui.view', channels)
+
+    def test_invalidate(self):
+        "Test record message invalidates the caches"
+        message = {
+            'type': 'record',
+            'model': 'party.party',
+            'ids': [1],
+            'timestamps': {'1': 'ts'},
+            }
+        with patch('tryton.rpc.invalidate_cache') as invalidate_cache, \
+                patch('tryton.rpc.clear_cache') as clear_cache, \
+                patch('tryton.common.selection.invalidate') as selection, \
+                patch('tryton.common.on_change.CACHE.invalidate') as cache, \
+                patch('tryton.common.completion.CACHE.invalidate'
+                    ) as completion, \
+                patch('tryton.gui.window.view_form.model.group.Group'
+                    '.records_changed') as records_changed:
+            bus.handle(message)
+
+        invalidate_cache.assert_called_once_with('party.party')
+        clear_cache.assert_not_called()
+        selection.assert_called_once_with('party.party')
+        cache.assert_called_once_with('party.party')
+        completion.assert_called_once_with('party.party')
+        records_changed.assert_called_once_with(
+            'party.party', [1], {'1': 'ts'})
+
+    def test_invalidate_own(self):
+        "Test record message from the client itself is ignored"
+        message = {
+            'type': 'record',
+            'model': 'party.party',
+            'ids': [1],
+            'client': bus.ID,
+            }
+        with patch('tryton.rpc.invalidate_cache') as invalidate_cache:
+            bus.handle(message)
+
+        invalidate_cache.assert_not_called()
@@ -0,0 +1,78 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+from unittest import TestCase
+
+from tryton.common.completion import CompletionCache
+
+
+class CompletionCacheTestCase(TestCase):
+    "Test CompletionCache"
+
+    results = [
+        {'id': 1, 'rec_name': 'Foo'},
+        {'id': 2, 'rec_name': 'Bar'},
+        {'id': 3, 'rec_name': 'foobar'},
+        ]
+
+    def key(self, text, domain=None):
+        return CompletionCache.key(
+            'test', domain or [], {}, None, 10, text)
+
+    def test_get(self):
+        "Test get cached results"
+        cache = CompletionCache()
+        cache.set(self.key('o'), self.results)
+
+        self.assertEqual(cache.get(self.key('o')), self.results)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_get_miss(self):
+        "Test get missing results"
+        cache = CompletionCache()
+        cache.set(self.key('o'), self.results)
+
+        self.assertIsNone(cache.get(self.key('o', [('id', '>', 1)])))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_get_sub_string(self):
+        "Test get does not reuse the results of a sub-string"
+        cache = CompletionCache()
+        cache.set(self.key('o'), self.results)
+
+        self.assertIsNone(cache.get(self.key('foo')))
+        stats = cache.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_rate'], 0)
+
+    def test_get_expired(self):
+        "Test get does not return expired results"
+        cache = CompletionCache()
+        cache.duration = -1
+        cache.set(self.key('o'), self.results)
+
+        self.assertIsNone(cache.get(self.key('o')))
+
+    def test_invalidate(self):
+        "Test invalidate removes the results of the model"
+        cache = CompletionCache()
+        cache.set(self.key('o'), self.results)
+        other = CompletionCache.key('other', [], {}, None, 10, 'o')
+        cache.set(other, self.results)
+        cache.invalidate('test')
+
+        self.assertIsNone(cache.get(self.key('o')))
+        self.assertEqual(cache.get(other), self.results)
+        self.assertEqual(cache.stats()['invalidations'], 1)
+
+    def test_size(self):
+        "Test least recently used results are evicted"
+        cache = CompletionCache()
+        cache.size = 2
+        cache.set(self.key('a'), [])
+        cache.set(self.key('b'), [])
+        cache.get(self.key('a'))
+        cache.set(self.key('c'), [])
+
+        self.assertEqual(cache.get(self.key('a')), [])
+        self.assertIsNone(cache.get(self.key('b')))
+        self.assertEqual(cache.stats()['entries'], 2)
@@ -0,0 +1,75 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+from unittest import TestCase
+
+from tryton.common.domain_inversion import (
+    compile_domain, domain_inversion, parse)
+
+
+class DomainInversionTestCase(TestCase):
+    "Test common domain_inversion"
+
+    def test_compile_cached(self):
+        "Test compile_domain is cached"
+        self.assertIs(
+            compile_domain([['x', '=', 1], ['y', '=', 2]]),
+            compile_domain([['x', '=', 1], ['y', '=', 2]]))
+
+    def test_compile_type(self):
+        "Test compile_domain distinguishes the type of values"
+        self.assertIsNot(
+            compile_domain([['x', '=', True]]),
+            compile_domain([['x', '=', 1]]))
+
+    def test_compile_copy(self):
+        "Test compile_domain is not altered by the domain"
+        domain = [['x', '=', 1], ['y', '>', 2]]
+        compile_domain(domain)
+
+        domain[1][2] = 5
+
+        self.assertEqual(
+            domain_inversion([['x', '=', 1], ['y', '>', 2]], 'x', {'y': 3}),
+            [['x', '=', 1]])
+
+    def test_compile_unhashable(self):
+        "Test compile_domain with unhashable value"
+        domain = [['x', 'in', {1, 2}]]
+
+        self.assertEqual(compile_domain(domain).variables, {'x'})
+
+    def test_inversion_constant(self):
+        "Test inversion without context is kept"
+        expression = parse([['x', '>', 1], ['x', '<', 5]])
+
+        self.assertFalse(expression.depends('x'))
+        self.assertIs(
+            expression.inverse('x', {}), expression.inverse('x', {'x': 2}))
+
+    def test_inversion_context(self):
+        "Test inversion is evaluated with the context"
+        domain = ['OR', ['x', '=', 1], ['y', '=', 2]]
+
+        self.assertEqual(domain_inversion(domain, 'x', {}), True)
+        self.assertEqual(domain_inversion(domain, 'x', {'y': 2}), True)
+        self.assertEqual(
+            domain_inversion(domain, 'x', {'y': 3}), [['x', '=', 1]])
+
+    def test_inversion_nested(self):
+        "Test inversion of nested domain"
+        domain = [
+            ['company', '=', 1],
+            ['OR',
+                [['x', '>', 0], ['type', '!=', 'out']],
+                [['x', '<', 0], ['amount', '>', 0]]]]
+
+        self.assertEqual(
+            domain_inversion(domain, 'x', {'company': 1}), True)
+        self.assertEqual(
+            domain_inversion(
+                domain, 'x', {'company': 1, 'type': 'in', 'amount': 0}),
+            [['x', '>', 0]])
+        self.assertEqual(
+            domain_inversion(
+                domain, 'x', {'company': 1, 'type': 'out', 'amount': 0}),
+            False)
@@ -0,0 +1,153 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+from tryton.common.image_loader import ImageLoader
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+        server.release.wait(5)
+        if self.path == '/missing':
+            self.send_error(404)
+            return
+        if (server.etag
+                and self.headers.get('If-None-Match') == server.etag):
+            self.send_response(304)
+            self.end_headers()
+            return
+        data = b'image:' + self.path.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(data)))
+        if server.cache_control:
+            self.send_header('Cache-Control', server.cache_control)
+        if server.etag:
+            self.send_header('ETag', server.etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StandInServer(ThreadingHTTPServer):
+    "Local HTTP server standing in for an image server"
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('localhost', 0), _Handler)
+        self.requests = []
+        self.cache_control = 'max-age=60'
+        self.etag = None
+        self.release = threading.Event()
+        self.release.set()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, path):
+        return 'http://localhost:%s%s' % (self.server_address[1], path)
+
+    def stop(self):
+        self.release.set()
+        self.shutdown()
+        self.server_close()
+
+
+class ImageLoaderTestCase(TestCase):
+    "Test ImageLoader"
+
+    def setUp(self):
+        self.server = StandInServer()
+        self.addCleanup(self.server.stop)
+        self.path = tempfile.TemporaryDirectory()
+        self.addCleanup(self.path.cleanup)
+
+    def loader(self, **kwargs):
+        loader = ImageLoader(path=self.path.name, **kwargs)
+        self.addCleanup(loader.shutdown)
+        return loader
+
+    def test_load(self):
+        "Test load calls back with the data"
+        loader = self.loader()
+        loaded = threading.Event()
+        result = []
+
+        loader.load(
+            self.server.url('/foo'),
+            lambda data: (result.append(data), loaded.set()))
+
+        self.assertTrue(loaded.wait(5))
+        self.assertEqual(result, [b'image:/foo'])
+
+    def test_load_error(self):
+        "Test load calls back with None on error"
+        loader = self.loader()
+        loaded = threading.Event()
+        result = []
+
+        loader.load(
+            self.server.url('/missing'),
+            lambda data: (result.append(data), loaded.set()))
+
+        self.assertTrue(loaded.wait(5))
+        self.assertEqual(result, [None])
+
+    def test_load_deduplicate(self):
+        "Test concurrent loads of the same url share the request"
+        loader = self.loader()
+        self.server.release.clear()
+        loaded = threading.Event()
+        result = []
+
+        for _ in range(3):
+            loader.load(
+                self.server.url('/foo'),
+                lambda data: (result.append(data), loaded.set()))
+        self.assertEqual(loader.pending(), 1)
+        self.server.release.set()
+
+        self.assertTrue(loaded.wait(5))
+        loader.shutdown()
+        self.assertEqual(result, [b'image:/foo'] * 3)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_fetch_cached(self):
+        "Test fetch uses the fresh data from the disk"
+        self.loader().fetch(self.server.url('/foo'))
+
+        data = self.loader().fetch(self.server.url('/foo'))
+
+        self.assertEqual(data, b'image:/foo')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_fetch_no_store(self):
+        "Test fetch does not store no-store response"
+        self.server.cache_control = 'no-store'
+        loader = self.loader()
+
+        loader.fetch(self.server.url('/foo'))
+        loader.fetch(self.server.url('/foo'))
+
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_fetch_revalidate(self):
+        "Test fetch revalidates stale data"
+        self.server.cache_control = 'no-cache'
+        self.server.etag = '"v1"'
+        loader = self.loader()
+
+        loader.fetch(self.server.url('/foo'))
+        data = loader.fetch(self.server.url('/foo'))
+
+        self.assertEqual(data, b'image:/foo')
+        self.assertEqual(len(self.server.requests), 2)
+        _, headers = self.server.requests[1]
+        self.assertEqual(headers.get('If-None-Match'), '"v1"')
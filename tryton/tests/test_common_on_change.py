@@ -0,0 +1,111 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import datetime as dt
+from decimal import Decimal
+from unittest import TestCase
+
+from tryton.common.on_change import OnChangeCache
+from tryton.config import CONFIG
+
+
+class OnChangeCacheTestCase(TestCase):
+    "Test OnChangeCache"
+
+    def setUp(self):
+        self.config = {
+            k: CONFIG.options.get(k) for k in [
+                'client.on_change_cache',
+                'client.on_change_cache_size',
+                'client.on_change_cache_duration']}
+        self.addCleanup(self.restore_config)
+
+    def restore_config(self):
+        for key, value in self.config.items():
+            if value is None:
+                CONFIG.options.pop(key, None)
+            else:
+                CONFIG.options[key] = value
+
+    def key(self, values, model='sale.line', method='on_change_product'):
+        return OnChangeCache.key(model, method, values, (), {'company': 1})
+
+    def test_enabled(self):
+        "Test enabled by model or method"
+        cache = OnChangeCache()
+        CONFIG.options['client.on_change_cache'] = (
+            'sale.line, account.invoice.line:on_change_product')
+
+        self.assertTrue(cache.enabled('sale.line', 'on_change_product'))
+        self.assertTrue(
+            cache.enabled('account.invoice.line', 'on_change_product'))
+        self.assertFalse(
+            cache.enabled('account.invoice.line', 'on_change_quantity'))
+        self.assertFalse(cache.enabled('sale.sale', 'on_change_party'))
+
+    def test_key(self):
+        "Test key does not depend on the order of the values"
+        self.assertEqual(
+            self.key({'product': 1, 'quantity': Decimal('2')}),
+            self.key({'quantity': Decimal('2'), 'product': 1}))
+        self.assertNotEqual(
+            self.key({'product': 1}), self.key({'product': 2}))
+
+    def test_get(self):
+        "Test get a copy of the cached result"
+        cache = OnChangeCache()
+        result = {'unit_price': Decimal('10'), 'date': dt.date(2020, 1, 1)}
+        cache.set(self.key({'product': 1}), result)
+
+        cached = cache.get(self.key({'product': 1}))
+        cached['unit_price'] = None
+
+        self.assertEqual(cache.get(self.key({'product': 1})), result)
+        self.assertEqual(cache.stats()['hits'], 2)
+
+    def test_get_miss(self):
+        "Test get missing result"
+        cache = OnChangeCache()
+        cache.set(self.key({'product': 1}), None)
+
+        with self.assertRaises(KeyError):
+            cache.get(self.key({'product': 2}))
+        self.assertIsNone(cache.get(self.key({'product': 1})))
+        self.assertEqual(cache.stats()['hit_rate'], 0.5)
+
+    def test_get_expired(self):
+        "Test get does not return expired result"
+        cache = OnChangeCache()
+        CONFIG.options['client.on_change_cache_duration'] = -1
+        cache.set(self.key({'product': 1}), None)
+
+        with self.assertRaises(KeyError):
+            cache.get(self.key({'product': 1}))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_size(self):
+        "Test least recently used results are evicted"
+        cache = OnChangeCache()
+        CONFIG.options['client.on_change_cache_size'] = 2
+        cache.set(self.key({'product': 1}), 1)
+        cache.set(self.key({'product': 2}), 2)
+        cache.get(self.key({'product': 1}))
+        cache.set(self.key({'product': 3}), 3)
+
+        self.assertEqual(cache.get(self.key({'product': 1})), 1)
+        with self.assertRaises(KeyError):
+            cache.get(self.key({'product': 2}))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_invalidate(self):
+        "Test invalidate removes the results of the model"
+        cache = OnChangeCache()
+        cache.set(self.key({'product': 1}), 1)
+        cache.set(self.key({'party': 1}, 'sale.sale', 'on_change_party'), 2)
+
+        cache.invalidate('sale.line')
+
+        with self.assertRaises(KeyError):
+            cache.get(self.key({'product': 1}))
+        self.assertEqual(
+            cache.get(self.key({'party': 1}, 'sale.sale', 'on_change_party')),
+            2)
@@ -0,0 +1,310 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+from tryton.jsonrpc import Fault, ServerPool, _Cache
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        request = json.loads(self.rfile.read(length))
+        self.server.requests.append((self.client_address, request))
+        if isinstance(request, list):
+            if not self.server.batch:
+                self.send_error(400)
+                return
+            response = [self.dispatch(r) for r in request]
+        else:
+            response = self.dispatch(request)
+        data = json.dumps(response).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        # Close without notifying the client like a server timeout
+        self.close_connection = self.server.drop
+
+    def dispatch(self, request):
+        method = getattr(self.server, 'rpc_' + request['method'].replace(
+                '.', '_'), None)
+        if method:
+            return {'id': request['id'], 'result': method(
+                    *request['params'])}
+        else:
+            return {'id': request['id'], 'error': [
+                    'NotFound', request['method']]}
+
+
+class StandInServer(ThreadingHTTPServer):
+    "Local JSON-RPC server standing in for trytond"
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('localhost', 0), _Handler)
+        self.requests = []
+        self.drop = False
+        self.batch = True
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def rpc_common_server_version(self):
+        return '6.4'
+
+    def rpc_model_test_add(self, a, b):
+        return a + b
+
+
+class ServerPoolTestCase(TestCase):
+    "Test ServerPool"
+
+    def setUp(self):
+        self.server = StandInServer()
+        self.addCleanup(self.server.stop)
+
+    def pool(self, **kwargs):
+        pool = ServerPool('localhost', self.server.port, 'test', **kwargs)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_reuse_connection(self):
+        "Test connection is reused"
+        pool = self.pool()
+        for _ in range(3):
+            with pool() as conn:
+                self.assertEqual(conn.model.test.add(1, 2), 3)
+
+        clients = {c for c, _ in self.server.requests}
+        self.assertEqual(len(clients), 1)
+        stats = pool.stats()
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['reused'], 2)
+        self.assertEqual(stats['connections'][0]['requests'], 3)
+
+    def test_keep_max(self):
+        "Test pool keeps at most keep_max connections"
+        pool = self.pool(keep_max=2)
+        conns = [pool.getconn() for _ in range(3)]
+        for conn in conns:
+            pool.putconn(conn)
+
+        stats = pool.stats()
+        self.assertEqual(stats['idle'], 2)
+        self.assertEqual(stats['discarded'], 1)
+        self.assertEqual(stats['peak'], 3)
+
+    def test_idle_timeout(self):
+        "Test idle connections expire down to keep_min"
+        pool = self.pool(keep_min=1, idle_timeout=10)
+        conns = [pool.getconn() for _ in range(3)]
+        for conn in conns:
+            pool.putconn(conn)
+        for conn in conns[:2]:
+            conn.last_used = time.monotonic() - 20
+
+        conn = pool.getconn()
+
+        self.assertIs(conn, conns[2])
+        self.assertEqual(pool.stats()['expired'], 2)
+
+    def test_dead_connection(self):
+        "Test connection closed by the server is not reused"
+        pool = self.pool()
+        self.server.drop = True
+        with pool() as conn:
+            conn.common.server.version()
+        time.sleep(0.1)
+
+        conn = pool.getconn()
+
+        self.assertEqual(pool.stats()['dead'], 1)
+        self.assertEqual(pool.stats()['created'], 2)
+        pool.putconn(conn)
+
+
+class BatchTestCase(TestCase):
+    "Test batch requests"
+
+    def setUp(self):
+        self.server = StandInServer()
+        self.addCleanup(self.server.stop)
+        self.pool = ServerPool('localhost', self.server.port, 'test')
+        self.addCleanup(self.pool.close)
+
+    def test_batch(self):
+        "Test calls are sent in one request"
+        results = self.pool.batch([
+                ('model.test.add', [1, 2]),
+                ('common.server.version', []),
+                ])
+
+        self.assertEqual(results, [3, '6.4'])
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertTrue(self.pool.batch_supported)
+
+    def test_batch_error(self):
+        "Test errors are returned per call"
+        results = self.pool.batch([
+                ('model.test.unknown', []),
+                ('model.test.add', [1, 2]),
+                ])
+
+        self.assertIsInstance(results[0], Fault)
+        self.assertEqual(results[1], 3)
+
+    def test_batch_unsupported(self):
+        "Test fall back to sequential calls"
+        self.server.batch = False
+
+        results = self.pool.batch([
+                ('model.test.add', [1, 2]),
+                ('model.test.add', [3, 4]),
+                ])
+        self.pool.batch([('model.test.add', [5, 6])])
+
+        self.assertEqual(results, [3, 7])
+        self.assertFalse(self.pool.batch_supported)
+        self.assertEqual(
+            [isinstance(r, list) for _, r in self.server.requests],
+            [True, False, False, False])
+
+
+class CacheTestCase(TestCase):
+    "Test _Cache"
+
+    def test_get(self):
+        "Test get returns a copy"
+        cache = _Cache()
+        cache.set('method', 'key', 10, {'foo': [1, 2]})
+
+        value = cache.get('method', 'key')
+        value['foo'].append(3)
+
+        self.assertEqual(cache.get('method', 'key'), {'foo': [1, 2]})
+        self.assertEqual(cache.stats()['hits'], 2)
+
+    def test_get_immutable(self):
+        "Test get returns the decoded immutable value"
+        cache = _Cache()
+        cache.set('method', 'key', 10, 'value')
+
+        self.assertEqual(cache.get('method', 'key'), 'value')
+        self.assertIs(
+            cache.get('method', 'key'), cache.get('method', 'key'))
+
+    def test_expire(self):
+        "Test expired entry is removed"
+        cache = _Cache()
+        cache.set('method', 'key', -1, 'value')
+
+        with self.assertRaises(KeyError):
+            cache.get('method', 'key')
+        stats = cache.stats()
+        self.assertEqual(stats['expired'], 1)
+        self.assertEqual(stats['entries'], 0)
+        self.assertEqual(stats['size'], 0)
+        self.assertTrue(cache.cached('method'))
+
+    def test_sweep(self):
+        "Test sweep of expired entries"
+        cache = _Cache()
+        cache.sweep_interval = 0
+        cache.set('method', 'foo', -1, 'value')
+        cache.set('method', 'bar', 10, 'value')
+
+        self.assertEqual(cache.stats()['entries'], 1)
+
+    def test_lru(self):
+        "Test least recently used entries are evicted"
+        cache = _Cache(max_size=20)
+        cache.set('method', 'a', 10, 'value')  # 8 bytes
+        cache.set('method', 'b', 10, 'value')
+        cache.get('method', 'a')
+        cache.set('method', 'c', 10, 'value')
+
+        self.assertEqual(cache.get('method', 'a'), 'value')
+        with self.assertRaises(KeyError):
+            cache.get('method', 'b')
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.size, 16)
+
+    def test_clear_prefix(self):
+        "Test clear prefix"
+        cache = _Cache()
+        cache.set('foo', 'key', 10, 'value')
+        cache.set('bar', 'key', 10, 'value')
+
+        cache.clear('foo')
+
+        self.assertEqual(cache.stats()['prefixes'], {'bar': 1})
+        self.assertEqual(cache.size, 10)
+
+    def test_invalidate(self):
+        "Test invalidate the methods of a model"
+        cache = _Cache()
+        cache.set('model.foo.read', 'key', 10, 'value')
+        cache.set('model.foo.bar.read', 'key', 10, 'value')
+
+        cache.invalidate('foo')
+
+        self.assertEqual(cache.stats()['prefixes'], {'model.foo.bar.read': 1})
+
+    def test_persistent(self):
+        "Test persistent methods are loaded from disk"
+        with tempfile.TemporaryDirectory() as path:
+            cache = _Cache(path=path)
+            cache.set('model.foo.fields_view_get', 'key', 10, {'arch': ''})
+            cache.set('model.foo.read', 'key', 10, 'value')
+
+            cache = _Cache(path=path)
+
+            self.assertTrue(cache.cached('model.foo.fields_view_get'))
+            self.assertFalse(cache.cached('model.foo.read'))
+            self.assertEqual(
+                cache.get('model.foo.fields_view_get', 'key'), {'arch': ''})
+            self.assertEqual(cache.stats()['loads'], 1)
+
+    def test_persistent_expire(self):
+        "Test expired entry on disk is removed"
+        with tempfile.TemporaryDirectory() as path:
+            cache = _Cache(path=path)
+            cache.set('model.foo.fields_get', 'key', -1, {})
+
+            cache = _Cache(path=path)
+
+            with self.assertRaises(KeyError):
+                cache.get('model.foo.fields_get', 'key')
+            self.assertEqual(
+                os.listdir(os.path.join(path, 'model.foo.fields_get')), [])
+
+    def test_persistent_clear(self):
+        "Test clear removes the entries on disk"
+        with tempfile.TemporaryDirectory() as path:
+            cache = _Cache(path=path)
+            cache.set('model.foo.fields_get', 'key', 10, {})
+
+            cache.clear('model.foo.fields_get')
+            cache = _Cache(path=path)
+
+            with self.assertRaises(KeyError):
+                cache.get('model.foo.fields_get', 'key')
@@ -0,0 +1,90 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import datetime
+from unittest import TestCase
+
+from tryton.pyson import (
+    And, Bool, Date, Equal, Eval, Get, Greater, If, In, Len, Not, Or,
+    PYSONDecoder, PYSONEncoder, compile, eval_names)
+
+
+class PYSONCompileTestCase(TestCase):
+    "Test PYSON compile"
+
+    context = {
+        'a': 1,
+        'b': False,
+        'state': 'draft',
+        'context': {'company': 3},
+        'lines': [1, 2],
+        'party': {'name': 'Foo'},
+        }
+
+    def assertCompileEqual(self, statement):
+        expr = PYSONEncoder().encode(statement)
+        self.assertEqual(
+            compile(expr)(self.context),
+            PYSONDecoder(self.context).decode(expr),
+            msg=expr)
+
+    def test_statements(self):
+        "Test compile statements"
+        for statement in [
+                Eval('a'),
+                Eval('unknown', 42),
+                Eval('party.name'),
+                Not(Eval('b')),
+                Bool(Eval('a')),
+                And(Eval('a'), Not(Eval('b'))),
+                Or(Eval('b'), Eval('a')),
+                Equal(Eval('state'), 'draft'),
+                Greater(Eval('a', 0), 0),
+                If(Eval('b'), 'foo', 'bar'),
+                Get(Eval('context', {}), 'company', 0),
+                In(Eval('state'), ['draft', 'done']),
+                Len(Eval('lines', [])),
+                [('a', '=', Eval('a')), ('b', 'in', [1, 2])],
+                {'readonly': Eval('state') != 'draft'},
+                ]:
+            self.assertCompileEqual(statement)
+
+    def test_date(self):
+        "Test compile Date"
+        expr = PYSONEncoder().encode(Date(delta_days=1))
+
+        self.assertEqual(
+            compile(expr)({}),
+            datetime.date.today() + datetime.timedelta(days=1))
+
+    def test_new_copy(self):
+        "Test compile returns a new copy of the values"
+        expr = PYSONEncoder().encode(
+            [('a', '=', 1), ('b', '=', Eval('a', []))])
+        func = compile(expr)
+
+        value = func({})
+        value[0].append('foo')
+        value[1][2].append('bar')
+
+        self.assertEqual(func({}), [['a', '=', 1], ['b', '=', []]])
+
+    def test_cached(self):
+        "Test compile is cached"
+        expr = PYSONEncoder().encode(Eval('a'))
+
+        self.assertIs(compile(expr), compile(expr))
+
+
+class PYSONEvalNamesTestCase(TestCase):
+    "Test PYSON eval_names"
+
+    def test_eval_names(self):
+        "Test eval_names"
+        expr = PYSONEncoder().encode({
+                'readonly': Eval('state') != 'draft',
+                'invisible': And(Eval('_parent_party.active'), Not(Eval('b'))),
+                'required': True,
+                })
+
+        self.assertEqual(
+            eval_names(expr), {'state', '_parent_party.active', 'b'})